@@ -0,0 +1,72 @@
+"""Function call benchmark
+
+usage: python benchmarks/calls.py [n ...]
+
+Runs call heavy programs (a recursive fib(n) and a deep chain of calls)
+with every backend and reports how many jutsu calls per second each one
+makes.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+from tokenizer import Tokenizer
+from parser import Parser
+import interpreter
+import compiler
+import transpiler
+from timing import bench, execute
+
+BACKENDS = (('closures', interpreter.process), ('bytecode', compiler.process), ('python', transpiler.process))
+
+FIB = """jutsu fib(n) {
+    if n < 2 {
+        release n
+    }
+    release fib(n - 1) + fib(n - 2)
+}
+print fib(%d)
+"""
+
+# the chain is not a tail call, so every backend keeps all of its frames
+CHAIN = """jutsu down(n) {
+    if n == 0 {
+        release 0
+    }
+    release down(n - 1) + 1
+}
+print down(%d)
+"""
+
+# chains stay below the recursion limit of the closure interpreter
+DEPTH = 1500
+
+def fibCalls(n):
+    """Number of calls fib(n) makes"""
+    a, b = 0, 1
+    for _ in range(n + 1):
+        a, b = b, a + b
+    return 2 * a - 1
+
+def batch(executor, ast, times):
+    """Run ast times times with executor"""
+    for _ in range(times):
+        execute(executor, ast)
+
+def main(sizes):
+    sys.setrecursionlimit(10000)
+    print("%-12s %10s" % ("program", "calls") + "".join(" %14s" % name for name, _ in BACKENDS))
+    cases = [("fib(%d)" % n, FIB % n, fibCalls(n), 1) for n in sizes]
+    cases.append(("down(%d)" % DEPTH, CHAIN % DEPTH, DEPTH + 1, 100))
+    for name, source, calls, times in cases:
+        ast = Parser(Tokenizer(source).tokenize()).ast
+        row = "%-12s %10d" % (name, calls * times)
+        for _, executor in BACKENDS:
+            _, elapsed = bench(batch, executor, ast, times)
+            row += " %14.0f" % (calls * times / elapsed)
+        print(row)
+    print("(calls per second)")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [20, 24])
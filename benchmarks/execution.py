@@ -0,0 +1,190 @@
+"""Interpreter speed benchmark
+
+usage: python benchmarks/execution.py [n ...]
+
+Runs a recursive fib(n), and a variable heavy variant of it, with a naive
+walker that branches on the kind of every node each time it visits it and
+with every backend (the closure compiling interpreter, the bytecode VM with
+and without quickening and the python transpiler), and reports the speedup
+of each backend over the naive walker. The walker reads the arrays of the
+arena directly, as the backends do, so the comparison does not include the
+cost of building node views.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+from tokenizer import Tokenizer, Type
+from parser import Parser, ASTNodeType
+from runtime import binaryops, augassigns, builtins, undefined
+import interpreter
+import compiler
+import transpiler
+from timing import bench, execute
+
+BACKENDS = (('closures', interpreter.process), ('bytecode', compiler.process), ('adaptive', compiler.processAdaptive), ('python', transpiler.process))
+
+PROGRAMS = {
+    'fib': """jutsu fib(n) {
+    if n < 2 {
+        release n
+    }
+    release fib(n - 1) + fib(n - 2)
+}
+print fib(%d)
+""",
+    'variables': """jutsu c(argOne, argTwo, argThree) {
+    x = argOne + argTwo
+    z = x * argThree
+    y = z - x + argOne
+    release y
+}
+jutsu work(n) {
+    if n < 2 {
+        release n
+    }
+    a = n - 1
+    b = n - 2
+    x = c(a, b, n)
+    release work(a) + work(b) + x - x
+}
+print work(%d)
+"""
+}
+
+class Release(Exception):
+    """Unwind a naive call with its return value"""
+
+    def __init__(self, value):
+        self.value = value
+
+class Definition:
+    """A function definition node, as the value of a name"""
+
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+# kind codes of the nodes the walker branches on
+NODE = ASTNodeType.Node._value_
+BODY = ASTNodeType.Body._value_
+ASSIGN = ASTNodeType.AssignStmt._value_
+IF = ASTNodeType.IfStmt._value_
+RETURN = ASTNodeType.ReturnStmt._value_
+CALL = ASTNodeType.CallStmt._value_
+EXPR = ASTNodeType.Expr._value_
+BINARY = ASTNodeType.BinaryOp._value_
+UNARY = ASTNodeType.UnaryOp._value_
+CONSTANTS = (ASTNodeType.IntegerConst._value_, ASTNodeType.StringConst._value_, ASTNodeType.BooleanConst._value_)
+VARIABLE = ASTNodeType.Variable._value_
+
+class Walker:
+    """Execute an AST by branching on the node kind of every visited node"""
+
+    # the walker reads the arrays of the arena directly, as the backends
+    # do when they compile, so it only pays for branching on every visit
+
+    def __init__(self, arena, env):
+        self.kinds = arena.kinds
+        self.values = arena.values
+        self.first = arena.first
+        self.next = arena.next
+        self.constants = arena.constants
+        self.env = env
+        self.frames = [env]
+
+    def run(self, index):
+        kinds, values, first, next = self.kinds, self.values, self.first, self.next
+        kind = kinds[index]
+        if kind == NODE or kind == BODY:
+            child = first[index]
+            while child != -1:
+                self.run(child)
+                child = next[child]
+        elif kind == ASSIGN:
+            if values[index] is not None:
+                self.frames[-1][values[index]] = Definition(index)
+            else:
+                target = first[index]
+                self.frames[-1][values[target]] = self.run(next[target])
+        elif kind == IF:
+            test = first[index]
+            if self.run(test):
+                self.run(next[test])
+        elif kind == RETURN:
+            child = first[index]
+            raise Release(self.run(child) if child != -1 else None)
+        elif kind == CALL:
+            name = values[index]
+            if name == Type.PRINT:
+                print(self.run(first[index]))
+                return
+            args = []
+            arg = first[index]
+            while arg != -1:
+                args.append(self.run(first[arg]))
+                arg = next[arg]
+            function = self.frames[-1].get(name, self.env.get(name, builtins.get(name)))
+            if function.__class__ is not Definition:
+                return function(*args)
+            frame = {}
+            child = first[function.index]
+            while next[child] != -1:
+                frame[values[child]] = args[len(frame)]
+                child = next[child]
+            self.frames.append(frame)
+            try:
+                self.run(child)
+            except Release as release:
+                return release.value
+            finally:
+                self.frames.pop()
+        elif kind == EXPR:
+            return self.run(first[index])
+        elif kind == BINARY:
+            left = first[index]
+            right = next[left]
+            op = augassigns.get(values[index], values[index])
+            if op == Type.OR:
+                return self.run(left) or self.run(right)
+            elif op == Type.AND:
+                return self.run(left) and self.run(right)
+            return binaryops[op](self.run(left), self.run(right))
+        elif kind == UNARY:
+            if values[index] == Type.NOT:
+                return not self.run(first[index])
+            return -self.run(first[index])
+        elif kind in CONSTANTS:
+            return self.constants[values[index]]
+        elif kind == VARIABLE:
+            name = values[index]
+            if name in self.frames[-1]:
+                return self.frames[-1][name]
+            if name in self.env:
+                return self.env[name]
+            undefined(name)
+        else:
+            raise Exception("Cannot walk node %d" % index)
+
+def walk(ast, env):
+    Walker(ast.arena, {}).run(ast.index)
+
+def main(sizes):
+    sys.setrecursionlimit(10000)
+    print("%10s %6s %10s" % ("program", "n", "naive") + "".join(" %10s %10s" % (name, "speedup") for name, _ in BACKENDS))
+    for program, source in PROGRAMS.items():
+        for n in sizes:
+            ast = Parser(Tokenizer(source % n).tokenize()).ast
+            expected, naive = bench(execute, walk, ast)
+            row = "%10s %6d %10.4f" % (program, n, naive)
+            for name, executor in BACKENDS:
+                output, elapsed = bench(execute, executor, ast)
+                if output != expected:
+                    raise Exception("%s(%d) printed %r with %s but the naive walker printed %r" % (program, n, output, name, expected))
+                row += " %10.4f %9.1fx" % (elapsed, naive / elapsed)
+            print(row)
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [15, 20, 22])
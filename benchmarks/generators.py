@@ -0,0 +1,94 @@
+"""Synthetic Jutsu programs of growing size, one generator per shape
+
+Every generator takes a size and returns the source of a program that
+grows linearly with it, so any stage that gets slower faster than its
+input does shows up when the sizes double.
+"""
+
+def name(i):
+    """Return a unique Jutsu name for i (names cannot contain digits)"""
+    letters = ''
+    while True:
+        letters += chr(ord('a') + i % 26)
+        i //= 26
+        if i == 0:
+            return letters
+
+def statements(size):
+    """size short top level statements"""
+    lines = ["total = 0"]
+    for i in range(size):
+        n = name(i)
+        if i % 4 == 0:
+            lines.append("v_%s = %d" % (n, i))
+        elif i % 4 == 1:
+            lines.append("total += v_%s * 2" % name(i - 1))
+        elif i % 4 == 2:
+            lines.append("s_%s = \"item\" + str(total)" % n)
+        else:
+            lines.append("print s_%s" % name(i - 1))
+    return '\n'.join(lines) + '\n'
+
+def nesting(size):
+    """size if blocks nested in each other, with an assignment in each"""
+    lines = ["depth = 0"]
+    for i in range(size):
+        indent = "    " * i
+        lines.append("%sif depth < %d {" % (indent, size))
+        lines.append("%s    depth += 1" % indent)
+    for i in reversed(range(size)):
+        lines.append("    " * i + "}")
+    lines.append("print depth")
+    return '\n'.join(lines) + '\n'
+
+def chains(size):
+    """One expression of size binary operators on a variable"""
+    ops = ('+', '-', '*', '//')
+    terms = ["x"]
+    for i in range(size):
+        # keeps the value small, so the big integers do not dominate
+        terms.append("%s %s" % (ops[i % 4], "x" if i % 4 != 3 else "2"))
+    return "x = 3\ny = %s\nprint y\n" % ' '.join(terms)
+
+def definitions(size):
+    """size jutsu definitions, each called once"""
+    chunks = []
+    for i in range(size):
+        n = name(i)
+        chunks.append(
+            "jutsu f_%s(a, b) {\n"
+            "    x = a + b * %d\n"
+            "    if x > %d {\n"
+            "        release x - a\n"
+            "    }\n"
+            "    release x\n"
+            "}\n"
+            "print f_%s(%d, 2)\n" % (n, i, i, n, i))
+    return ''.join(chunks)
+
+def calls(size):
+    """size functions calling each other as a binary tree, called from the root a few times"""
+    chunks = []
+    for i in range(size):
+        left, right = 2 * i + 1, 2 * i + 2
+        if right < size:
+            body = "release f_%s(v + 1) + f_%s(v - 1)" % (name(left), name(right))
+        elif left < size:
+            body = "release f_%s(v * 2)" % name(left)
+        else:
+            body = "release v * 2"
+        chunks.append("jutsu f_%s(v) {\n    %s\n}\n" % (name(i), body))
+    chunks.append("total = 0\n")
+    for i in range(10):
+        chunks.append("total += f_a(%d)\n" % i)
+    chunks.append("print total\n")
+    return ''.join(chunks)
+
+# the program shapes, with the sizes a default run goes through
+SHAPES = {
+    'statements': (statements, (1000, 2000, 4000, 8000)),
+    'nesting': (nesting, (25, 50, 100, 200)),
+    'chains': (chains, (250, 500, 1000, 2000)),
+    'definitions': (definitions, (250, 500, 1000, 2000)),
+    'calls': (calls, (250, 500, 1000, 2000))
+}
@@ -0,0 +1,46 @@
+"""Parser throughput benchmark
+
+usage: python benchmarks/parsing.py [lines ...]
+
+Generates Jutsu programs of the given sizes (in lines), tokenizes them
+once and reports how many tokens per second Parser gets through.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+from tokenizer import Tokenizer
+from parser import Parser
+from generators import name
+from timing import bench
+
+def generate(lines):
+    """Return a program of roughly the given number of lines"""
+    chunks = []
+    for i in range(0, lines, 12):
+        n = name(i)
+        chunks.append(
+            "jutsu f_%s(a, b) {\n"
+            "    x = a + b * %d\n"
+            "    x += a\n"
+            "    release x\n"
+            "}\n"
+            "v_%s = %d\n"
+            "w_%s = f_%s(v_%s, 2) - 1\n"
+            "if w_%s > 10 and !(v_%s == 3) {\n"
+            "    print w_%s // 2\n"
+            "}\n"
+            "print \"done\"\n"
+            "f_%s(1, 2)\n" % (n, i, n, i, n, n, n, n, n, n, n))
+    return ''.join(chunks)
+
+def main(sizes):
+    print("%10s %10s %10s %14s" % ("lines", "tokens", "seconds", "tokens/sec"))
+    for lines in sizes:
+        tokens = Tokenizer(generate(lines)).tokenize()
+        _, elapsed = bench(Parser, tokens)
+        print("%10d %10d %10.4f %14.0f" % (lines, len(tokens), elapsed, len(tokens) / elapsed))
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,144 @@
+"""Pipeline stage benchmark
+
+usage: python benchmarks/stages.py [-o file] [-c file] [-x scale] [shape ...]
+
+Generates programs of every shape in generators.py (or only the named ones)
+at growing sizes and times Tokenizer.tokenize, Parser and every backend on
+each of them separately. Reports tokens per second and peak memory for
+every stage and size, and the growth of the time between two sizes as an
+exponent of the growth of the program: about 1 is linear, and stages that
+get clearly worse than that are marked.
+
+-o file  : save the results as JSON
+-c file  : compare the times with the results saved by an earlier run
+-x scale : multiply the default sizes of every shape
+"""
+import functools
+import gc
+import getopt
+import json
+import math
+import os
+import platform
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+from tokenizer import Tokenizer
+from parser import Parser
+import interpreter
+import compiler
+import transpiler
+from generators import SHAPES
+from timing import bench, execute
+
+BACKENDS = (('closures', interpreter.process), ('bytecode', compiler.process), ('adaptive', compiler.processAdaptive), ('python', transpiler.process))
+
+# growth exponents above this are marked as super-linear
+SUPERLINEAR = 1.3
+
+# times that grew by more than this over a compared run are marked
+REGRESSION = 1.2
+
+STAGES = (('tokenize', lambda source: Tokenizer(source).tokenize()), ('parse', lambda tokens: Parser(tokens).ast)) + \
+    tuple((name, functools.partial(execute, executor)) for name, executor in BACKENDS)
+
+def peak(stage, data):
+    """Return the peak memory traced during one run of stage(data)"""
+    # tracing slows every allocation down, so memory gets a run of its own
+    gc.collect()
+    tracemalloc.start()
+    stage(data)
+    traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return traced
+
+def measure(shape, size):
+    """Return the timings of every stage for one program"""
+    source = SHAPES[shape][0](size)
+    results = {}
+    output = None
+    data = source
+    for name, stage in STAGES:
+        result, seconds = bench(stage, data, repeat = 5)
+        memory = peak(stage, data)
+        if name == 'tokenize':
+            data = tokens = result
+        elif name == 'parse':
+            data = result
+        elif output is None:
+            output = result
+        elif result != output:
+            raise Exception("%s(%d) printed %r with %s but %r with %s" % (shape, size, result, name, output, STAGES[2][0]))
+        results[name] = {'seconds': seconds, 'tokens/sec': len(tokens) / seconds, 'peak': memory}
+    return {'size': size, 'lines': source.count('\n'), 'tokens': len(tokens), 'stages': results}
+
+def growth(runs):
+    """Add the growth exponent of every stage between each run and the one before"""
+    for before, after in zip(runs, runs[1:]):
+        for name, stage in after['stages'].items():
+            ratio = math.log(after['tokens'] / before['tokens'])
+            stage['growth'] = math.log(stage['seconds'] / before['stages'][name]['seconds']) / ratio
+
+def compare(results, baseline):
+    """Print the times of results relative to the same runs in baseline"""
+    print("\ncompared with %s" % baseline['python'])
+    print("%-12s %6s %-10s %8s" % ("shape", "size", "stage", "time"))
+    for shape, runs in results['shapes'].items():
+        old = {run['size']: run for run in baseline['shapes'].get(shape, ())}
+        for run in runs:
+            if run['size'] not in old:
+                continue
+            for name, stage in run['stages'].items():
+                before = old[run['size']]['stages'].get(name)
+                if before is None:
+                    continue
+                ratio = stage['seconds'] / before['seconds']
+                mark = "  slower" if ratio > REGRESSION else ""
+                print("%-12s %6d %-10s %7.2fx%s" % (shape, run['size'], name, ratio, mark))
+
+def main(shapes, scale, output, baseline):
+    sys.setrecursionlimit(10000)
+    results = {'python': platform.python_version(), 'shapes': {}}
+    print("%-12s %6s %8s %-10s %10s %14s %12s %7s" % ("shape", "size", "tokens", "stage", "seconds", "tokens/sec", "peak bytes", "growth"))
+    for shape in shapes:
+        runs = [measure(shape, int(size * scale)) for size in SHAPES[shape][1]]
+        growth(runs)
+        results['shapes'][shape] = runs
+        for run in runs:
+            for name, stage in run['stages'].items():
+                exponent = stage.get('growth')
+                if exponent is None:
+                    grown = ""
+                else:
+                    grown = "%7.2f" % exponent + ("  super-linear" if exponent > SUPERLINEAR else "")
+                print("%-12s %6d %8d %-10s %10.4f %14.0f %12d %s" % (shape, run['size'], run['tokens'], name, stage['seconds'], stage['tokens/sec'], stage['peak'], grown))
+    if output is not None:
+        with open(output, mode='w') as file:
+            json.dump(results, file, indent = 2)
+    if baseline is not None:
+        with open(baseline, mode='r') as file:
+            compare(results, json.load(file))
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "o:c:x:")
+    except getopt.GetoptError as err:
+        print(err)
+        print(__doc__)
+        sys.exit(2)
+    output = baseline = None
+    scale = 1.0
+    for o, a in opts:
+        if o == "-o":
+            output = a
+        elif o == "-c":
+            baseline = a
+        elif o == "-x":
+            scale = float(a)
+    for shape in args:
+        if shape not in SHAPES:
+            print("unknown shape %s, one of %s" % (shape, ", ".join(SHAPES)))
+            sys.exit(2)
+    main(args or list(SHAPES), scale, output, baseline)
@@ -0,0 +1,55 @@
+"""Startup latency benchmark
+
+usage: python benchmarks/startup.py [runs]
+
+Runs tests/helloworld.ju end to end, as a new process every time, with
+python code/driver.py (with and without the __jucache__ and with every
+backend) and with the installed jutsu binary if there is one on the PATH,
+and reports the fastest and the median wall time of each. python -c pass
+is timed too, as the floor every python run starts from.
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DRIVER = os.path.join(ROOT, 'code', 'driver.py')
+HELLO = os.path.join(ROOT, 'tests', 'helloworld.ju')
+
+def commands():
+    """Return the name and command line of everything to time"""
+    python = sys.executable
+    found = [
+        ("python -c pass", [python, '-c', 'pass']),
+        ("driver", [python, DRIVER, HELLO]),
+        ("driver --no-cache", [python, DRIVER, '--no-cache', HELLO]),
+        ("driver -c", [python, DRIVER, '-c', HELLO]),
+        ("driver -p", [python, DRIVER, '-p', HELLO])
+    ]
+    jutsu = shutil.which('jutsu')
+    if jutsu is not None:
+        found.append(("jutsu (%s)" % jutsu, [jutsu, HELLO]))
+    return found
+
+def bench(command, runs):
+    """Return the wall time of every run of command"""
+    # one run first, so the cache and the files are warm
+    subprocess.run(command, stdout = subprocess.DEVNULL, check = True)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout = subprocess.DEVNULL, check = True)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main(runs):
+    print("%-40s %10s %10s" % ("command", "best ms", "median ms"))
+    for name, command in commands():
+        times = bench(command, runs)
+        print("%-40s %10.1f %10.1f" % (name, min(times) * 1000, statistics.median(times) * 1000))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
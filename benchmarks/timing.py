@@ -0,0 +1,32 @@
+"""Timing helpers shared by the benchmarks"""
+import contextlib
+import gc
+import io
+import time
+
+from runtime import Globals
+
+def bench(function, *args, repeat = 3):
+    """Return the result of function(*args) and its best time out of repeat runs"""
+    # like timeit, keep the garbage collector out of the measurement
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best
+
+def execute(executor, ast):
+    """Run an AST with executor and return what it printed"""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        env = Globals()
+        # every call is made, results of pure functions are not cached
+        env.memosize = 0
+        executor(ast, env)
+    return out.getvalue()
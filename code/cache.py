@@ -0,0 +1,52 @@
+import hashlib
+import os
+import pickle
+
+# a cache file is MAGIC, the pickled key of the script it was made from and
+# the pickled Arena of its AST, kept in DIRECTORY next to the script
+MAGIC = b'JUC\x04'
+DIRECTORY = '__jucache__'
+
+def path(script):
+    """Return the cache file of a script"""
+    directory, name = os.path.split(os.path.abspath(script))
+    return os.path.join(directory, DIRECTORY, os.path.splitext(name)[0] + '.juc')
+
+def key(script, version):
+    """Return the version, mtime, size and hash a cache file must match"""
+    stat = os.stat(script)
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(script, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return (version, stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+def load(script, key):
+    """Return the cached AST of a script, or None if there is no valid one"""
+    try:
+        with open(path(script), 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC or pickle.load(file) != key:
+                return None
+            return pickle.load(file).node(0)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+def store(script, key, ast):
+    """Write the AST of a script to its cache file"""
+    # the cache is only an optimization, so a directory that cannot be
+    # written is not an error. the file is replaced atomically so a run
+    # in parallel never reads half of it
+    target = path(script)
+    temporary = "%s.%d" % (target, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok = True)
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC)
+            pickle.dump(key, file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(ast.arena, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, target)
+    except OSError:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
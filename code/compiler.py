@@ -1,2 +1,741 @@
-def process(ast, env):
-    return NotImplementedError
\ No newline at end of file
+from array import array
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES, Pool
+from runtime import binaryops, builtins, undefined, arity, memokey, isFunction, binaryChain, UNBOUND, MISSING
+from resolver import Resolver, LOCAL
+import purity
+
+# opcodes, every instruction is an opcode followed by one argument
+CONST = 1           # push constants[arg] of the program
+LOAD_LOCAL = 2      # push locals[arg]
+STORE_LOCAL = 3     # pop into locals[arg]
+LOAD_GLOBAL = 4     # push the global (or builtin) in slot arg
+STORE_GLOBAL = 5    # pop into the global slot arg
+BINARY = 6          # pop two values and push operators[arg] applied to them
+NOT = 7             # replace the top of the stack by its negation
+NEGATE = 8          # replace the top of the stack by minus itself
+JUMP_IF_FALSE = 9   # pop and continue at arg if false
+JUMP_OR_POP = 10    # continue at arg if the top is true, else pop it (or)
+JUMP_AND_POP = 11   # continue at arg if the top is false, else pop it (and)
+CALL = 12           # call the function below arg arguments
+RETURN = 13         # return the top of the stack to the caller
+PRINT = 14          # pop and print
+POP = 15            # pop and throw away
+TAILCALL = 16       # call like CALL in place of the running function and return
+
+# only emitted when profiling, see profiler.py
+LINE = 17           # count a hit of source line arg
+ENTER = 18          # the function starts running
+LEAVE = 19          # the function stops running, before its RETURN or TAILCALL
+
+# adaptive mode emits BINARY_ADAPTIVE, which quickens itself into one of
+# the specialized forms after it. they take the same argument, check the
+# types of their operands and turn back into BINARY_ADAPTIVE when the
+# check fails. every opcode above BINARY_ADAPTIVE is a quickened one
+BINARY_ADAPTIVE = 20 # BINARY that counts the types it sees
+LOCAL_LEFT = 21     # LOAD_LOCAL of an int, the left operand of a CONST_RIGHT and an int form
+CONST_RIGHT = 22    # CONST whose value is the right operand of the specialized form after it
+ADD_INT = 23
+SUB_INT = 24
+MUL_INT = 25
+IDIV_INT = 26
+MOD_INT = 27
+EQ_INT = 28
+NE_INT = 29
+LT_INT = 30
+GT_INT = 31
+LE_INT = 32
+GE_INT = 33
+ADD_STR = 34
+EQ_STR = 35
+NE_STR = 36
+
+OPNAMES = {value: name for name, value in globals().items() if name.isupper() and isinstance(value, int)}
+
+# operators by BINARY argument
+operators = list(binaryops.values())
+operatorcodes = {op: code for code, op in enumerate(binaryops)}
+
+# specialized instruction of a BINARY argument, by the type of both operands
+specializations = {
+    int: {
+        operatorcodes[Type.PLUS]: ADD_INT,
+        operatorcodes[Type.MINUS]: SUB_INT,
+        operatorcodes[Type.MULT]: MUL_INT,
+        operatorcodes[Type.IDIV]: IDIV_INT,
+        operatorcodes[Type.PERCENT]: MOD_INT,
+        operatorcodes[Type.DEQ]: EQ_INT,
+        operatorcodes[Type.NEQ]: NE_INT,
+        operatorcodes[Type.LT]: LT_INT,
+        operatorcodes[Type.GT]: GT_INT,
+        operatorcodes[Type.LEQ]: LE_INT,
+        operatorcodes[Type.GEQ]: GE_INT
+    },
+    str: {
+        operatorcodes[Type.PLUS]: ADD_STR,
+        operatorcodes[Type.DEQ]: EQ_STR,
+        operatorcodes[Type.NEQ]: NE_STR
+    }
+}
+QUICKENED = set(specializations[int].values()) | set(specializations[str].values()) | {BINARY_ADAPTIVE}
+
+# runs of a BINARY_ADAPTIVE with the same operand types before it is
+# specialized, and failed type checks before it settles as BINARY
+WARMUP = 8
+RETRIES = 4
+
+class Code:
+    """A compiled jutsu function or program"""
+
+    def __init__(self, name, arity, locals, names, pool):
+        self.name = name
+        self.arity = arity
+        # names of the local slots, and of the global slots of the program
+        self.locals = locals
+        self.names = names
+        # unbound values for the local slots after the parameters
+        self.padding = [UNBOUND] * (len(locals) - arity)
+        self.ops = array('i')
+        # source line of every instruction, and the line being emitted
+        self.lines = array('i')
+        self.line = 0
+        # constant pool of the program, shared by all its code
+        self.pool = pool
+        self.constants = pool.constants
+        # result cache of a pure function
+        self.memo = None
+        # runs so far and failed type checks of the instructions being
+        # quickened, by position
+        self.warmup = {}
+        self.misses = {}
+
+    def __repr__(self):
+        return "<jutsu %s>" % self.name
+
+    def emit(self, op, arg = 0):
+        """Append an instruction and return its position"""
+        self.ops.append(op)
+        self.ops.append(arg)
+        self.lines.append(self.line)
+        return len(self.ops) - 2
+
+    def patch(self, position):
+        """Point the jump at position to the next instruction"""
+        self.ops[position + 1] = len(self.ops)
+
+    def disassemble(self):
+        """Return the instructions as readable text, one per line"""
+        lines = []
+        for position in range(0, len(self.ops), 2):
+            op, arg = self.ops[position], self.ops[position + 1]
+            if op == CONST or op == CONST_RIGHT:
+                detail = repr(self.constants[arg])
+            elif op == LOAD_GLOBAL or op == STORE_GLOBAL:
+                detail = self.names[arg]
+            elif op == LOAD_LOCAL or op == STORE_LOCAL or op == LOCAL_LEFT:
+                detail = self.locals[arg]
+            elif op == BINARY or op in QUICKENED:
+                detail = list(binaryops)[arg].name
+            else:
+                detail = str(arg)
+            lines.append("%6d %6d %-14s %s" % (self.lines[position // 2], position, OPNAMES[op], detail))
+        return '\n'.join(lines)
+
+class BytecodeCompiler:
+    """Lower an AST to bytecode for the VM"""
+
+    def __init__(self, resolver, pure = (), adaptive = False):
+        self.arena = resolver.arena
+        self.resolver = resolver
+        # function definitions that get a result cache
+        self.pure = pure
+        # instruction emitted for binary operators
+        self.binary = BINARY_ADAPTIVE if adaptive else BINARY
+        # the code being emitted, and the code of the program
+        self.code = None
+        self.program = None
+        # whether to emit the instructions that report to the profiler
+        self.profiling = resolver.env.profiler is not None
+
+    def kind(self, index):
+        return NODETYPES[self.arena.kinds[index]]
+
+    def children(self, index):
+        return list(self.arena.children(index))
+
+    def compileProgram(self, index):
+        # the pool starts out as the literals of the arena, so their nodes
+        # give the CONST argument, and grows with None and the functions
+        pool = Pool(self.arena.constants)
+        self.code = self.program = Code("program", 0, [], self.resolver.env.names, pool)
+        self.compileBody(index)
+        self.code.emit(CONST, self.code.pool.intern(None))
+        self.code.emit(RETURN)
+        return self.code
+
+    def compileBody(self, index):
+        for child in self.arena.children(index):
+            self.compileStatement(child)
+
+    def compileStatement(self, index):
+        kind = self.kind(index)
+        self.code.line = self.arena.lines[index]
+        if self.profiling:
+            self.code.emit(LINE, self.code.line)
+        if kind == ASTNodeType.Expr:
+            # the value of an expression statement is thrown away
+            self.compileExpression(index)
+            self.code.emit(POP)
+        else:
+            self.statements[kind](self, index)
+
+    def compileAssignment(self, index):
+        if isFunction(self.arena, index):
+            self.compileFunction(index)
+            return
+        target, expression = self.children(index)
+        self.compileExpression(expression)
+        self.store(target)
+
+    def compileFunction(self, index):
+        children = self.children(index)
+        name = self.arena.values[index]
+        outer = self.code
+        self.code = Code(name, len(children) - 1, self.resolver.frames[index], outer.names, outer.pool)
+        self.code.line = outer.line
+        if self.profiling:
+            self.code.emit(ENTER)
+        self.compileBody(children[-1])
+        self.code.emit(CONST, self.code.pool.intern(None))
+        self.leave()
+        self.code.emit(RETURN)
+        function = self.code
+        self.code = outer
+        if index in self.pure:
+            function.memo = self.resolver.env.memo(name)
+
+        self.code.emit(CONST, self.code.pool.intern(function))
+        self.store(index)
+
+    def leave(self):
+        """Emit the LEAVE of a function about to return, when profiling"""
+        if self.profiling and self.code is not self.program:
+            self.code.emit(LEAVE)
+
+    def store(self, index):
+        """Emit the store of the top of the stack into the variable resolved at index"""
+        slot = self.resolver.slots[index]
+        self.code.emit(STORE_LOCAL if self.resolver.scopes[index] == LOCAL else STORE_GLOBAL, slot)
+
+    def compileReturn(self, index):
+        children = self.children(index)
+        if not children:
+            self.code.emit(CONST, self.code.pool.intern(None))
+            self.leave()
+            self.code.emit(RETURN)
+            return
+        # release f(...) is a tail call, the callee reuses the frame of
+        # the function instead of growing the frame stack
+        expression = children[0]
+        while self.kind(expression) == ASTNodeType.Expr:
+            expression = self.arena.first[expression]
+        if self.kind(expression) == ASTNodeType.CallStmt:
+            args = self.compileArguments(expression)
+            self.leave()
+            self.code.emit(TAILCALL, args)
+            return
+        self.compileExpression(expression)
+        self.leave()
+        self.code.emit(RETURN)
+
+    def compilePrint(self, index):
+        if self.arena.values[index] != Type.PRINT:
+            self.compileExpression(index)
+            self.code.emit(POP)
+            return
+        self.compileExpression(self.arena.first[index])
+        self.code.emit(PRINT)
+
+    def compileIf(self, index):
+        test, body = self.children(index)
+        self.compileExpression(test)
+        jump = self.code.emit(JUMP_IF_FALSE)
+        self.compileBody(body)
+        self.code.patch(jump)
+
+    def compileExpression(self, index):
+        self.expressions[self.kind(index)](self, index)
+
+    def compileExpr(self, index):
+        self.compileExpression(self.arena.first[index])
+
+    def compileBinary(self, index):
+        index, chain = binaryChain(self.arena, index)
+        self.compileExpression(index)
+
+        for op, right in chain:
+            if op == Type.OR or op == Type.AND:
+                jump = self.code.emit(JUMP_OR_POP if op == Type.OR else JUMP_AND_POP)
+                self.compileExpression(right)
+                self.code.patch(jump)
+            else:
+                self.compileExpression(right)
+                self.code.emit(self.binary, operatorcodes[op])
+
+    def compileUnary(self, index):
+        self.compileExpression(self.arena.first[index])
+        self.code.emit(NOT if self.arena.values[index] == Type.NOT else NEGATE)
+
+    def compileConstant(self, index):
+        # literals keep their index in the pool of the arena
+        self.code.emit(CONST, self.arena.values[index])
+
+    def compileVariable(self, index):
+        slot = self.resolver.slots[index]
+        self.code.emit(LOAD_LOCAL if self.resolver.scopes[index] == LOCAL else LOAD_GLOBAL, slot)
+
+    def compileCall(self, index):
+        self.code.emit(CALL, self.compileArguments(index))
+
+    def compileArguments(self, index):
+        """Emit the function and arguments of a call, return the argument count"""
+        self.compileVariable(index)
+        args = 0
+        for child in self.arena.children(index):
+            self.compileExpression(self.arena.first[child])
+            args += 1
+        return args
+
+    statements = {
+        ASTNodeType.AssignStmt: compileAssignment,
+        ASTNodeType.ReturnStmt: compileReturn,
+        ASTNodeType.CallStmt: compilePrint,
+        ASTNodeType.IfStmt: compileIf
+    }
+
+    expressions = {
+        ASTNodeType.Expr: compileExpr,
+        ASTNodeType.BinaryOp: compileBinary,
+        ASTNodeType.UnaryOp: compileUnary,
+        ASTNodeType.IntegerConst: compileConstant,
+        ASTNodeType.StringConst: compileConstant,
+        ASTNodeType.BooleanConst: compileConstant,
+        ASTNodeType.Variable: compileVariable,
+        ASTNodeType.CallStmt: compileCall
+    }
+
+def quicken(code, position, left, right):
+    """Count a run of the BINARY_ADAPTIVE at position, specializing it once warm"""
+    ops = code.ops
+    arg = ops[position + 1]
+    kind = type(left)
+    forms = specializations.get(kind) if kind is type(right) else None
+    op = forms.get(arg) if forms else None
+    if op is not None:
+        runs = code.warmup.get(position, 0) + 1
+        if runs < WARMUP:
+            code.warmup[position] = runs
+        else:
+            del code.warmup[position]
+            ops[position] = op
+            # a constant right operand is read by the specialized form, and
+            # so is a local left operand of an int form with an int constant
+            if position and ops[position - 2] == CONST:
+                ops[position - 2] = CONST_RIGHT
+                if position > 2 and ops[position - 4] == LOAD_LOCAL and kind is int and type(code.constants[ops[position - 1]]) is int:
+                    ops[position - 4] = LOCAL_LEFT
+    elif arg in specializations[int] or arg in specializations[str]:
+        miss(code, position)
+    else:
+        # an operator like / or ** has no specialized form at all
+        ops[position] = BINARY
+
+def deoptimize(code, position, left, right):
+    """Return the value of a specialized instruction whose type check failed, and turn it back"""
+    miss(code, position)
+    return operators[code.ops[position + 1]](left, right)
+
+def miss(code, position):
+    """Turn the instruction at position back into BINARY_ADAPTIVE after a failed type check"""
+    code.warmup.pop(position, None)
+    if position and code.ops[position - 2] == CONST_RIGHT:
+        code.ops[position - 2] = CONST
+        if position > 2 and code.ops[position - 4] == LOCAL_LEFT:
+            code.ops[position - 4] = LOAD_LOCAL
+    misses = code.misses.get(position, 0) + 1
+    code.misses[position] = misses
+    # operands whose types keep changing stay with the generic instruction
+    code.ops[position] = BINARY_ADAPTIVE if misses < RETRIES else BINARY
+
+def run(program, env):
+    """Run compiled code on a stack VM with globals env"""
+    # jutsu calls push a frame on an explicit stack instead of recursing,
+    # so deep jutsu recursion never touches the python recursion limit.
+    # a frame also holds the memo and key the value returned to it is
+    # stored under, when the call was a miss of a memoized function
+    frames = []
+    stack = []
+    code = program
+    ops = code.ops
+    # the code of one program shares its constants, but functions from an
+    # earlier REPL fragment come with the pool of that fragment
+    constants = code.constants
+    values = env.values
+    names = env.names
+    local = []
+    pc = 0
+    push = stack.append
+    pop = stack.pop
+
+    while True:
+        op = ops[pc]
+        arg = ops[pc + 1]
+        pc += 2
+
+        if op == LOAD_LOCAL:
+            value = local[arg]
+            if value is UNBOUND:
+                undefined(code.locals[arg])
+            push(value)
+        elif op == CONST:
+            push(constants[arg])
+        elif op == BINARY:
+            right = pop()
+            stack[-1] = operators[arg](stack[-1], right)
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == LOAD_GLOBAL:
+            value = values[arg]
+            if value is UNBOUND:
+                if names[arg] not in builtins:
+                    undefined(names[arg])
+                value = builtins[names[arg]]
+            push(value)
+        elif op == CALL:
+            function = stack[-arg - 1]
+            if type(function) is Code:
+                if arg != function.arity:
+                    arity(function.name, function.arity, arg)
+                pending = None
+                if function.memo is not None:
+                    key = memokey(stack[len(stack) - arg:])
+                    value = function.memo.get(key)
+                    if value is not MISSING:
+                        del stack[-arg - 1:]
+                        push(value)
+                        continue
+                    pending = (function.memo, key)
+                frames.append((code, ops, pc, local, pending))
+                # the arguments on the stack become the frame
+                local = stack[len(stack) - arg:]
+                local += function.padding
+                del stack[-arg - 1:]
+                code = function
+                ops = code.ops
+                constants = code.constants
+                pc = 0
+            else:
+                args = stack[len(stack) - arg:]
+                del stack[-arg - 1:]
+                push(function(*args))
+        elif op == RETURN:
+            if not frames:
+                return
+            code, ops, pc, local, pending = frames.pop()
+            constants = code.constants
+            if pending is not None:
+                pending[0].put(pending[1], stack[-1])
+        elif op == TAILCALL:
+            function = stack[-arg - 1]
+            if type(function) is Code and function.memo is not None and arg == function.arity:
+                # a tail call only reads the memo, the frame below still
+                # stores the value the running call ends with
+                value = function.memo.get(memokey(stack[len(stack) - arg:]))
+                if value is not MISSING:
+                    del stack[-arg - 1:]
+                    push(value)
+                    if not frames:
+                        return
+                    code, ops, pc, local, pending = frames.pop()
+                    constants = code.constants
+                    if pending is not None:
+                        pending[0].put(pending[1], value)
+                    continue
+            if type(function) is Code:
+                if arg != function.arity:
+                    arity(function.name, function.arity, arg)
+                # same as CALL, but the frame of the caller is dropped
+                local = stack[len(stack) - arg:]
+                local += function.padding
+                del stack[-arg - 1:]
+                code = function
+                ops = code.ops
+                constants = code.constants
+                pc = 0
+            else:
+                args = stack[len(stack) - arg:]
+                del stack[-arg - 1:]
+                push(function(*args))
+                if not frames:
+                    return
+                code, ops, pc, local, pending = frames.pop()
+                constants = code.constants
+                if pending is not None:
+                    pending[0].put(pending[1], stack[-1])
+        elif op == STORE_LOCAL:
+            local[arg] = pop()
+        elif op == STORE_GLOBAL:
+            values[arg] = pop()
+        elif op == POP:
+            pop()
+        elif op == PRINT:
+            print(pop())
+        elif op == NOT:
+            stack[-1] = not stack[-1]
+        elif op == NEGATE:
+            stack[-1] = -stack[-1]
+        elif op == JUMP_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == JUMP_AND_POP:
+            if not stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == LINE:
+            env.profiler.hit(arg)
+        elif op == ENTER:
+            env.profiler.enter(code.name)
+        elif op == LEAVE:
+            env.profiler.exit()
+        else:
+            raise Exception("Invalid opcode %d at %d" % (op, pc - 2))
+
+def runAdaptive(program, env):
+    """Run adaptive code on the stack VM with globals env"""
+    # the loop of run with the instructions of adaptive mode, where binary
+    # operators rewrite themselves to the form specialized for the types
+    # they see, see quicken. it is a loop of its own so code compiled
+    # without them does not pay for checking them
+    frames = []
+    stack = []
+    code = program
+    ops = code.ops
+    # the code of one program shares its constants, but functions from an
+    # earlier REPL fragment come with the pool of that fragment
+    constants = code.constants
+    values = env.values
+    names = env.names
+    local = []
+    pc = 0
+    push = stack.append
+    pop = stack.pop
+
+    while True:
+        op = ops[pc]
+        arg = ops[pc + 1]
+        pc += 2
+
+        if op == LOAD_LOCAL:
+            value = local[arg]
+            if value is UNBOUND:
+                undefined(code.locals[arg])
+            push(value)
+        elif op == CONST:
+            push(constants[arg])
+        elif op > BINARY_ADAPTIVE:
+            # the quickened forms are checked early and in one range, so the
+            # other instructions pay a single comparison for them. a type
+            # check on the operands guards all the forms of that type
+            if op == LOCAL_LEFT:
+                left = local[arg]
+                push(left)
+                if left.__class__ is not int:
+                    # runs as the LOAD_LOCAL it was, and the int form after
+                    # it deoptimizes all three
+                    if left is UNBOUND:
+                        undefined(code.locals[arg])
+                    continue
+                # the CONST_RIGHT and the form after it run right here
+                right = constants[ops[pc + 1]]
+                op = ops[pc + 2]
+                arg = ops[pc + 3]
+                pc += 4
+            elif op == CONST_RIGHT:
+                # the constant is not pushed, the form after it runs right
+                # here without being dispatched itself
+                right = constants[arg]
+                op = ops[pc]
+                arg = ops[pc + 1]
+                pc += 2
+            else:
+                right = pop()
+            left = stack[-1]
+            if op < ADD_STR:
+                if left.__class__ is int is right.__class__:
+                    if op == SUB_INT:
+                        stack[-1] = left - right
+                    elif op == ADD_INT:
+                        stack[-1] = left + right
+                    elif op == LT_INT:
+                        stack[-1] = left < right
+                    elif op == EQ_INT:
+                        stack[-1] = left == right
+                    elif op == MUL_INT:
+                        stack[-1] = left * right
+                    elif op == GT_INT:
+                        stack[-1] = left > right
+                    elif op == LE_INT:
+                        stack[-1] = left <= right
+                    elif op == GE_INT:
+                        stack[-1] = left >= right
+                    elif op == NE_INT:
+                        stack[-1] = left != right
+                    elif op == MOD_INT:
+                        stack[-1] = left % right
+                    else:
+                        stack[-1] = left // right
+                else:
+                    stack[-1] = deoptimize(code, pc - 2, left, right)
+            elif left.__class__ is str is right.__class__:
+                if op == ADD_STR:
+                    stack[-1] = left + right
+                elif op == EQ_STR:
+                    stack[-1] = left == right
+                else:
+                    stack[-1] = left != right
+            else:
+                stack[-1] = deoptimize(code, pc - 2, left, right)
+        elif op == BINARY:
+            right = pop()
+            stack[-1] = operators[arg](stack[-1], right)
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == LOAD_GLOBAL:
+            value = values[arg]
+            if value is UNBOUND:
+                if names[arg] not in builtins:
+                    undefined(names[arg])
+                value = builtins[names[arg]]
+            push(value)
+        elif op == CALL:
+            function = stack[-arg - 1]
+            if type(function) is Code:
+                if arg != function.arity:
+                    arity(function.name, function.arity, arg)
+                pending = None
+                if function.memo is not None:
+                    key = memokey(stack[len(stack) - arg:])
+                    value = function.memo.get(key)
+                    if value is not MISSING:
+                        del stack[-arg - 1:]
+                        push(value)
+                        continue
+                    pending = (function.memo, key)
+                frames.append((code, ops, pc, local, pending))
+                # the arguments on the stack become the frame
+                local = stack[len(stack) - arg:]
+                local += function.padding
+                del stack[-arg - 1:]
+                code = function
+                ops = code.ops
+                constants = code.constants
+                pc = 0
+            else:
+                args = stack[len(stack) - arg:]
+                del stack[-arg - 1:]
+                push(function(*args))
+        elif op == RETURN:
+            if not frames:
+                return
+            code, ops, pc, local, pending = frames.pop()
+            constants = code.constants
+            if pending is not None:
+                pending[0].put(pending[1], stack[-1])
+        elif op == TAILCALL:
+            function = stack[-arg - 1]
+            if type(function) is Code and function.memo is not None and arg == function.arity:
+                # a tail call only reads the memo, the frame below still
+                # stores the value the running call ends with
+                value = function.memo.get(memokey(stack[len(stack) - arg:]))
+                if value is not MISSING:
+                    del stack[-arg - 1:]
+                    push(value)
+                    if not frames:
+                        return
+                    code, ops, pc, local, pending = frames.pop()
+                    constants = code.constants
+                    if pending is not None:
+                        pending[0].put(pending[1], value)
+                    continue
+            if type(function) is Code:
+                if arg != function.arity:
+                    arity(function.name, function.arity, arg)
+                # same as CALL, but the frame of the caller is dropped
+                local = stack[len(stack) - arg:]
+                local += function.padding
+                del stack[-arg - 1:]
+                code = function
+                ops = code.ops
+                constants = code.constants
+                pc = 0
+            else:
+                args = stack[len(stack) - arg:]
+                del stack[-arg - 1:]
+                push(function(*args))
+                if not frames:
+                    return
+                code, ops, pc, local, pending = frames.pop()
+                constants = code.constants
+                if pending is not None:
+                    pending[0].put(pending[1], stack[-1])
+        elif op == STORE_LOCAL:
+            local[arg] = pop()
+        elif op == STORE_GLOBAL:
+            values[arg] = pop()
+        elif op == POP:
+            pop()
+        elif op == PRINT:
+            print(pop())
+        elif op == NOT:
+            stack[-1] = not stack[-1]
+        elif op == NEGATE:
+            stack[-1] = -stack[-1]
+        elif op == JUMP_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == JUMP_AND_POP:
+            if not stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == BINARY_ADAPTIVE:
+            # only runs until the site is specialized or settles as BINARY
+            right = pop()
+            left = stack[-1]
+            stack[-1] = operators[arg](left, right)
+            quicken(code, pc - 2, left, right)
+        elif op == LINE:
+            env.profiler.hit(arg)
+        elif op == ENTER:
+            env.profiler.enter(code.name)
+        elif op == LEAVE:
+            env.profiler.exit()
+        else:
+            raise Exception("Invalid opcode %d at %d" % (op, pc - 2))
+
+def process(ast, env, adaptive = False):
+    resolver = Resolver(ast.arena, env).resolve(ast.index)
+    pure = purity.analyze(resolver, ast.index) if env.memosize > 0 else ()
+    code = BytecodeCompiler(resolver, pure, adaptive).compileProgram(ast.index)
+    (runAdaptive if adaptive else run)(code, env)
+
+def processAdaptive(ast, env):
+    """Run an AST on the VM with quickening binary operators"""
+    process(ast, env, True)
@@ -1,76 +1,234 @@
-from tokenizer import Tokenizer
-from parser import Parser
-import compiler
-import interpreter
-import sys, getopt
+from tokenizer import Tokenizer, TokenStore
+from parser import Parser, TokenBuffer
+import cache
+import optimizer
+from runtime import Globals, MEMOSIZE
+import sys, getopt, atexit, contextlib, importlib, mmap
+
+# modules only some runs need (the backends, dumps, the REPL and the
+# instrumentation) are imported when an option or the input asks for them,
+# so starting up only pays for the front end
 
 VERSION = "0.0.0"
 
 def usage():
     print("usage: jutsu [option] ... [file | -] [arg] ...")
     print("-c     : use compiler instead of the default interpreter (also --compile)")
+    print("-p     : translate to python and run it with exec instead of the interpreter (also --python)")
+    print("--adaptive : use the compiler, with binary operators that specialize to the types they see")
     print("-h     : print this help message and exit (also --help)")
-    print("-v     : verbose (also --verbose)")
+    print("-v     : verbose, dump tokens and AST (also --verbose)")
+    print("--json : write verbose dumps as JSON")
+    print("--no-cache : always parse the script, without reading or writing __jucache__")
+    print("--memo-size n : results cached per pure function (default %d, 0 turns memoization off)" % MEMOSIZE)
+    print("--instrument file : write the time, CPU time and net blocks allocated of every stage as JSON to file (- for stderr)")
+    print("--trace-memory : with --instrument, also report the peak memory of every stage (slows every stage down)")
+    print("--profile file : print calls and time of every function and hits of every line to stderr, and write the collapsed stacks to file")
     print("-V     : print the Jutsu version number and exit (also --version)")
     print("file   : program read from script file")
     print("-      : program read from stdin (default)")
     print("arg ...: arguments passed to program in sys.argv[1:]")
 
-def execute(executor, text):
-    tokens = Tokenizer(text).tokenize()
-    print("\nTOKENS")
-    print(tokens)
-    ast = Parser(tokens).ast
-    print("\nAST")
-    print(ast)
-    executor(ast, env)
-
-env = {}
-
-try:
-    opts, args = getopt.getopt(sys.argv[1:],"hvc",["help", "verbose", "compile"])
-except getopt.GetoptError as err:
-    print(err)
-    usage()
-    sys.exit(2)
-
-output = None
-verbose = False
-executor = interpreter.process
-for o, a in opts:
-    if o in ("-v", "--verbose"):
-        verbose = True
-    elif o in ("-h", "--help"):
-        usage()
-        sys.exit()
-    elif o in ("-c", "--compile"):
-        executor = compiler.process
-    elif o in ("-V, --version"):
-        print("Jutsu", VERSION)
-        sys.exit()
+# what stage() returns when nothing is instrumented
+UNTIMED = contextlib.nullcontext()
+
+def stage(name):
+    """Return the context manager a pipeline stage runs in"""
+    return UNTIMED if instrumented is None else instrumented.stage(name)
+
+def parse(source):
+    if isinstance(source, str) or instrumented is not None:
+        # instrumented runs give the tokenizer a stage of its own instead
+        # of having it feed the parser
+        with stage('tokenize'):
+            tokens = Tokenizer(source).tokenize()
     else:
-        assert False, "unhandled option"
-
-if len(args) >= 1:
-    # TODO remove
-    print(args[0])
-    file = open(args[0], mode='r')
-    targs = args[1:]  # TODO add functionality to actually use tail args
-    text = file.read()
-    file.close()
-    execute(executor, text)  
-else:
-    print("Jutsu", VERSION)
-    print("Type \"help\" for more information.")
-    while True:
+        # scan the mapped file one window at a time so the whole program
+        # is never held in memory
+        tokens = Tokenizer(source).stores()
+    if verbose:
+        tokens = dumped = dump.tokens(tokens, sys.stdout, dumpform)
+    if not isinstance(tokens, TokenStore):
+        tokens = TokenBuffer(tokens)
+    with stage('parse'):
+        ast = Parser(tokens).ast
+    if verbose:
+        dumped.close()
+        dump.ast(ast, sys.stdout, dumpform)
+    if ast is not None:
+        with stage('optimize'):
+            report = optimizer.optimize(ast)
+        if verbose:
+            dump.report("OPTIMIZER", report, sys.stdout, dumpform)
+    return ast
+
+def backend(executor):
+    """Return the function of an executor, importing its module"""
+    module, name = executor
+    return getattr(importlib.import_module(module), name)
+
+def parseFile(script):
+    """Parse a script file, scanning it where it is mapped in memory"""
+    with open(script, mode='rb') as file:
         try:
-            text = input(">>> ")
-        except EOFError:
-            break
+            source = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty files and files that cannot be mapped are read instead
+            return parse(file.read())
+        with source:
+            return parse(source)
+
+def execute(executor, source):
+    run(executor, parse(source))
+
+def executeFile(executor, script):
+    """Run a script file, from its cached AST if the script did not change"""
+    if not caching:
+        run(executor, parseFile(script))
+        return
+    key = cache.key(script, VERSION)
+    # verbose runs parse anyway so the tokens can be dumped
+    ast = None
+    if not verbose:
+        with stage('load'):
+            ast = cache.load(script, key)
+    if ast is None:
+        ast = parseFile(script)
+        if ast is not None:
+            with stage('store'):
+                cache.store(script, key, ast)
+    run(executor, ast)
+
+def run(executor, ast):
+    if ast is None:
+        return
+    try:
+        with stage('execute'):
+            if env.profiler is None:
+                backend(executor)(ast, env)
+            else:
+                profile(backend(executor), ast)
+    except Exception as e:
+        print("Exception during execution:")
+        print(e)
+    if verbose and env.memos:
+        dump.report("MEMO", env.memoCounts(), sys.stdout, dumpform)
 
-        if text == 'help':
+def profile(executor, ast):
+    """Run an AST with the profiler timing it"""
+    env.profiler.start()
+    try:
+        executor(ast, env)
+    finally:
+        env.profiler.stop()
+
+def flame(path):
+    """Write the profile table to stderr and the collapsed stacks to path"""
+    env.profiler.table(sys.stderr)
+    with open(path, mode='w') as file:
+        env.profiler.collapsed(file)
+
+def report(path):
+    """Write the instrumented stages to path, or to stderr for -"""
+    if path == '-':
+        instrumented.write(sys.stderr)
+    else:
+        with open(path, mode='w') as file:
+            instrumented.write(file)
+
+env = Globals()
+
+# settings of the run, which the options below change. the helpers above
+# only read them, so they can also be imported from here as they are
+verbose = False
+dumpform = 'text'
+caching = True
+instrumented = None
+
+# every jutsu call is several nested python calls in the executors
+sys.setrecursionlimit(10000)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],"hvcpV",["help", "verbose", "compile", "python", "json", "no-cache", "memo-size=", "adaptive", "instrument=", "trace-memory", "profile=", "version"])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    tracing = False
+    # module and function of the executor
+    executor = ('interpreter', 'process')
+    for o, a in opts:
+        if o in ("-v", "--verbose"):
+            verbose = True
+            import dump
+        elif o in ("-h", "--help"):
             usage()
-        if text == 'quit':
+            sys.exit()
+        elif o in ("-c", "--compile"):
+            executor = ('compiler', 'process')
+        elif o in ("-p", "--python"):
+            executor = ('transpiler', 'process')
+        elif o == "--adaptive":
+            executor = ('compiler', 'processAdaptive')
+        elif o == "--json":
+            dumpform = 'json'
+        elif o == "--no-cache":
+            caching = False
+        elif o == "--memo-size":
+            try:
+                env.memosize = max(int(a), 0)
+            except ValueError:
+                print("--memo-size takes a number of results")
+                sys.exit(2)
+        elif o == "--instrument":
+            from instrument import Instrument
+            instrumented = Instrument()
+            atexit.register(report, a)
+        elif o == "--trace-memory":
+            tracing = True
+        elif o == "--profile":
+            from profiler import Profiler
+            env.profiler = Profiler()
+            atexit.register(flame, a)
+        elif o in ("-V", "--version"):
+            print("Jutsu", VERSION)
             sys.exit()
         else:
-            execute(executor, text)
\ No newline at end of file
+            assert False, "unhandled option"
+
+    if tracing:
+        if instrumented is None:
+            print("--trace-memory needs --instrument")
+            sys.exit(2)
+        instrumented.trace()
+
+    if len(args) >= 1:
+        targs = args[1:]  # TODO add functionality to actually use tail args
+        executeFile(executor, args[0])
+    else:
+        # later lines can redefine the functions a cached result came from
+        env.memosize = 0
+        env.interactive = True
+        print("Jutsu", VERSION)
+        print("Type \"help\" for more information.")
+        import repl
+        session = repl.Session(lambda source: execute(executor, source))
+        while True:
+            try:
+                text = input("... " if session.pending() else ">>> ")
+            except EOFError:
+                break
+            except KeyboardInterrupt:
+                # drop the fragment being entered, like python does
+                print("\nKeyboardInterrupt")
+                session.reset()
+                continue
+
+            if not session.pending() and text == 'help':
+                usage()
+            elif not session.pending() and text == 'quit':
+                sys.exit()
+            else:
+                session.feed(text)
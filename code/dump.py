@@ -0,0 +1,54 @@
+import json
+from tokenizer import Type, TokenStore
+
+def tokens(stores, file, form = 'text'):
+    """Yield TokenStores, writing their tokens to file as they pass through"""
+    if form == 'json':
+        start, separator, end = '{"tokens":[', ',', ']}\n'
+        write = lambda token: json.dumps([token.type.name, token.value, token.line], separators=(',', ':'))
+    else:
+        start, separator, end = "\nTOKENS\n[", ', ', "]\n"
+        write = repr
+
+    # the dump is closed as soon as EOF passes so that it is complete
+    # before the parser reports anything, or when the stream is closed
+    # early because parsing stopped on an error
+    file.write(start)
+    closed = False
+    if isinstance(stores, TokenStore):
+        stores = [stores]
+    try:
+        i = 0
+        for store in stores:
+            for index in range(len(store)):
+                token = store[index]
+                file.write((separator if i else '') + write(token))
+                i += 1
+                if token.type == Type.EOF:
+                    file.write(end)
+                    closed = True
+            yield store
+    finally:
+        if not closed:
+            file.write(end)
+
+def ast(node, file, form = 'text'):
+    """Write the AST under node to file"""
+    if node is None:
+        return
+    if form == 'json':
+        file.write('{"ast":')
+        node.arena.writeJSON(file, node.index)
+        file.write('}\n')
+    else:
+        file.write("\nAST\n")
+        node.arena.write(file, node.index)
+
+def report(name, counts, file, form = 'text'):
+    """Write the counters of a pipeline stage to file"""
+    if form == 'json':
+        file.write(json.dumps({name.lower(): counts}, separators=(',', ':')) + '\n')
+    else:
+        file.write("\n" + name + "\n")
+        for counter, count in counts.items():
+            file.write("%s: %d\n" % (counter, count))
@@ -0,0 +1,75 @@
+import json
+import sys
+import time
+import tracemalloc
+
+class Instrument:
+    """Measure the stages of the driver pipeline and report them as JSON"""
+
+    # for every stage the wall and CPU time and its net blocks, the change
+    # in the number of memory blocks python has allocated (blocks freed
+    # during the stage cancel out blocks allocated). tracing memory slows every
+    # allocation down several times, so the most memory traced while a
+    # stage ran is only measured after trace() and the times are then no
+    # longer those of a normal run. a stage that runs more than once, like
+    # parsing in the REPL, adds up its runs and keeps its highest peak
+
+    def __init__(self):
+        self.stages = {}
+        self.tracing = False
+
+    def trace(self):
+        """Also measure the peak memory of every stage, with tracemalloc"""
+        self.tracing = True
+        tracemalloc.start()
+
+    def stage(self, name):
+        """Return a context manager that runs its block as a stage"""
+        return Stage(self, name)
+
+    def add(self, name, wall, cpu, blocks, peak):
+        counts = self.stages.get(name)
+        if counts is None:
+            counts = self.stages[name] = {'runs': 0, 'wall': 0.0, 'cpu': 0.0, 'net blocks': 0}
+        counts['runs'] += 1
+        counts['wall'] += wall
+        counts['cpu'] += cpu
+        counts['net blocks'] += blocks
+        if peak is not None:
+            counts['peak'] = max(counts.get('peak', 0), peak)
+
+    def report(self):
+        """Return the counts of every stage and their totals"""
+        stages = self.stages.values()
+        total = {
+            'wall': sum(counts['wall'] for counts in stages),
+            'cpu': sum(counts['cpu'] for counts in stages),
+            'net blocks': sum(counts['net blocks'] for counts in stages)
+        }
+        if self.tracing:
+            total['peak'] = max((counts['peak'] for counts in stages), default = 0)
+        return {'stages': self.stages, 'total': total}
+
+    def write(self, file):
+        file.write(json.dumps(self.report(), indent = 2) + '\n')
+
+class Stage:
+    """Context manager for one run of a stage"""
+
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+
+    def __enter__(self):
+        if self.instrument.tracing:
+            tracemalloc.reset_peak()
+        self.blocks = sys.getallocatedblocks()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        blocks = sys.getallocatedblocks() - self.blocks
+        peak = tracemalloc.get_traced_memory()[1] if self.instrument.tracing else None
+        self.instrument.add(self.name, wall, cpu, blocks, peak)
@@ -1,2 +1,426 @@
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES
+from runtime import binaryops, builtins, undefined, arity, memokey, isFunction, binaryChain, CHAIN, UNBOUND, MISSING
+from resolver import Resolver, LOCAL
+import purity
+
+# closure factory for every binary operator, the operator is picked once
+# when the node is compiled and baked into the closure
+binaries = {
+    Type.PLUS: lambda left, right: lambda frame: left(frame) + right(frame),
+    Type.MINUS: lambda left, right: lambda frame: left(frame) - right(frame),
+    Type.MULT: lambda left, right: lambda frame: left(frame) * right(frame),
+    Type.DIV: lambda left, right: lambda frame: left(frame) / right(frame),
+    Type.IDIV: lambda left, right: lambda frame: left(frame) // right(frame),
+    Type.PERCENT: lambda left, right: lambda frame: left(frame) % right(frame),
+    Type.DSTAR: lambda left, right: lambda frame: left(frame) ** right(frame),
+    Type.DEQ: lambda left, right: lambda frame: left(frame) == right(frame),
+    Type.NEQ: lambda left, right: lambda frame: left(frame) != right(frame),
+    Type.LT: lambda left, right: lambda frame: left(frame) < right(frame),
+    Type.GT: lambda left, right: lambda frame: left(frame) > right(frame),
+    Type.LEQ: lambda left, right: lambda frame: left(frame) <= right(frame),
+    Type.GEQ: lambda left, right: lambda frame: left(frame) >= right(frame),
+    Type.OR: lambda left, right: lambda frame: left(frame) or right(frame),
+    Type.AND: lambda left, right: lambda frame: left(frame) and right(frame)
+}
+
+unaries = {
+    Type.NOT: lambda operand: lambda frame: not operand(frame),
+    Type.MINUS: lambda operand: lambda frame: -operand(frame)
+}
+
+class Function:
+    """A jutsu function compiled to closures"""
+
+    # a call builds the frame of the function directly out of the argument
+    # values and the padding, the frame is the only allocation of a call
+
+    def __init__(self, name, arity, size, body):
+        self.name = name
+        self.arity = arity
+        # the local slots after the parameters start out unbound
+        self.padding = [UNBOUND] * (size - arity)
+        self.body = body
+
+    def __repr__(self):
+        return "<jutsu %s>" % self.name
+
+class Memoized(Function):
+    """A pure jutsu function that keeps its results in a Memo"""
+
+    # a class of its own keeps memoized functions off the fast paths of
+    # compileCall, which only take plain Functions
+
+    def __init__(self, name, arity, size, body, memo):
+        super().__init__(name, arity, size, body)
+        self.memo = memo
+
+    def call(self, args):
+        if len(args) != self.arity:
+            arity(self.name, self.arity, len(args))
+        key = memokey(args)
+        value = self.memo.get(key)
+        if value is MISSING:
+            args += self.padding
+            result = self.body(args)
+            value = result and (result[0] if len(result) == 1 else bounce(result))
+            self.memo.put(key, value)
+        return value
+
+def invoke(function, args):
+    """Call a jutsu function or a builtin with a list of argument values"""
+    if function.__class__ is Function:
+        if len(args) != function.arity:
+            arity(function.name, function.arity, len(args))
+        # the argument list becomes the frame
+        args += function.padding
+        result = function.body(args)
+        return result and (result[0] if len(result) == 1 else bounce(result))
+    if function.__class__ is Memoized:
+        return function.call(args)
+    return function(*args)
+
+def bounce(result):
+    """Run the tail calls a function body returned until one gives a value"""
+    # a body returns (function, args) for release f(...), so the call is
+    # made here after the frame of the caller is gone and tail recursion
+    # runs in constant stack
+    while True:
+        function, args = result
+        if function.__class__ is not Function:
+            if function.__class__ is not Memoized:
+                return function(*args)
+            # a tail call only reads the memo of its function, the call
+            # that started the bounce stores the value it ends with
+            if len(args) == function.arity:
+                value = function.memo.get(memokey(args))
+                if value is not MISSING:
+                    return value
+        if len(args) != function.arity:
+            arity(function.name, function.arity, len(args))
+        args += function.padding
+        result = function.body(args)
+        if result is None:
+            return None
+        if len(result) == 1:
+            return result[0]
+
+class ClosureCompiler:
+    """Compile an AST into a tree of python closures, one per node"""
+
+    # every closure takes the frame (the list of local slots of the running
+    # function) as its only argument, globals are read from the slots of
+    # the Globals. expressions return their value; statements return None,
+    # a 1-tuple holding the value of a release, or a (function, args) pair
+    # for a release of a call, which the caller runs with bounce()
+
+    def __init__(self, resolver, pure = ()):
+        self.arena = resolver.arena
+        self.resolver = resolver
+        self.globals = resolver.env.values
+        # function definitions that get a result cache
+        self.pure = pure
+        # statements and function bodies report to it when profiling
+        self.profiler = resolver.env.profiler
+        # compiled bodies waiting for the if or function they belong to
+        self.bodies = {}
+
+    def kind(self, index):
+        return NODETYPES[self.arena.kinds[index]]
+
+    def children(self, index):
+        return list(self.arena.children(index))
+
+    def compileBody(self, index):
+        """Compile a body and every body nested in it, innermost first"""
+        # the bodies of ifs and functions are found with a work stack
+        # instead of recursion, so deep nesting stays clear of the python
+        # recursion limit. compileIf and compileFunction then pick up
+        # their body already compiled
+        order = []
+        stack = [index]
+        while stack:
+            body = stack.pop()
+            order.append(body)
+            for child in self.arena.children(body):
+                kind = self.kind(child)
+                if kind == ASTNodeType.IfStmt or (kind == ASTNodeType.AssignStmt and isFunction(self.arena, child)):
+                    stack.append(self.arena.last[child])
+        for body in reversed(order):
+            self.bodies[body] = self.compileStatements(body)
+        return self.bodies.pop(index)
+
+    def compileStatements(self, index):
+        """Compile the statements of a body whose nested bodies are compiled"""
+        statements = [self.compileStatement(child) for child in self.arena.children(index)]
+        if len(statements) == 1:
+            return statements[0]
+
+        def body(frame):
+            for statement in statements:
+                result = statement(frame)
+                if result is not None:
+                    return result
+        return body
+
+    def compileStatement(self, index):
+        kind = self.kind(index)
+        if kind == ASTNodeType.Expr:
+            # the value of an expression statement is thrown away
+            expression = self.compileExpression(index)
+
+            def statement(frame):
+                expression(frame)
+        else:
+            statement = self.statements[kind](self, index)
+        if self.profiler is None:
+            return statement
+        hit = self.profiler.hit
+        line = self.arena.lines[index]
+
+        def profiled(frame):
+            hit(line)
+            return statement(frame)
+        return profiled
+
+    def compileAssignment(self, index):
+        if isFunction(self.arena, index):
+            return self.compileFunction(index)
+        target, expression = self.children(index)
+        return self.store(target, self.compileExpression(expression))
+
+    def compileFunction(self, index):
+        children = self.children(index)
+        name = self.arena.values[index]
+        size = len(self.resolver.frames[index])
+        body = self.bodies.pop(children[-1])
+        if self.profiler is not None:
+            body = self.profile(name, body)
+        if index in self.pure:
+            memo = self.resolver.env.memo(name)
+            function = Memoized(name, len(children) - 1, size, body, memo)
+        else:
+            function = Function(name, len(children) - 1, size, body)
+        return self.store(index, lambda frame: function)
+
+    def profile(self, name, body):
+        """Return a body that tells the profiler when it starts and stops running"""
+        enter = self.profiler.enter
+        exit = self.profiler.exit
+
+        def profiled(frame):
+            enter(name)
+            try:
+                return body(frame)
+            finally:
+                exit()
+        return profiled
+
+    def store(self, index, value):
+        """Return a statement that stores value in the variable resolved at index"""
+        slot = self.resolver.slots[index]
+        if self.resolver.scopes[index] == LOCAL:
+            def assign(frame):
+                frame[slot] = value(frame)
+        else:
+            env = self.globals
+
+            def assign(frame):
+                env[slot] = value(frame)
+        return assign
+
+    def compileReturn(self, index):
+        children = self.children(index)
+        if not children:
+            return lambda frame: (None,)
+        expression = children[0]
+        while self.kind(expression) == ASTNodeType.Expr:
+            expression = self.arena.first[expression]
+        if self.kind(expression) != ASTNodeType.CallStmt:
+            value = self.compileExpression(expression)
+            return lambda frame: (value(frame),)
+
+        # release f(...) hands the call back to the caller instead of making it
+        function = self.compileCallee(expression)
+        args = [self.compileExpression(self.arena.first[child]) for child in self.arena.children(expression)]
+        if len(args) == 1:
+            first, = args
+            return lambda frame: (function(frame), [first(frame)])
+        elif len(args) == 2:
+            first, second = args
+            return lambda frame: (function(frame), [first(frame), second(frame)])
+        return lambda frame: (function(frame), [arg(frame) for arg in args])
+
+    def compilePrint(self, index):
+        if self.arena.values[index] != Type.PRINT:
+            call = self.compileExpression(index)
+
+            def statement(frame):
+                call(frame)
+            return statement
+
+        value = self.compileExpression(self.arena.first[index])
+
+        def output(frame):
+            print(value(frame))
+        return output
+
+    def compileIf(self, index):
+        test, body = self.children(index)
+        test = self.compileExpression(test)
+        body = self.bodies.pop(body)
+
+        def conditional(frame):
+            if test(frame):
+                return body(frame)
+        return conditional
+
+    def compileExpression(self, index):
+        return self.expressions[self.kind(index)](self, index)
+
+    def compileExpr(self, index):
+        # Expr only wraps its child, so it gets no closure of its own
+        return self.compileExpression(self.arena.first[index])
+
+    def compileBinary(self, index):
+        index, chain = binaryChain(self.arena, index)
+        value = self.compileExpression(index)
+
+        if len(chain) <= CHAIN:
+            for op, right in chain:
+                value = binaries[op](value, self.compileExpression(right))
+            return value
+
+        first = value
+        # or and and keep their Type so they can still short circuit
+        rest = [(binaryops.get(op, op), self.compileExpression(right)) for op, right in chain]
+
+        def loop(frame):
+            value = first(frame)
+            for op, right in rest:
+                if op == Type.OR:
+                    value = value or right(frame)
+                elif op == Type.AND:
+                    value = value and right(frame)
+                else:
+                    value = op(value, right(frame))
+            return value
+        return loop
+
+    def compileUnary(self, index):
+        return unaries[self.arena.values[index]](self.compileExpression(self.arena.first[index]))
+
+    def compileConstant(self, index):
+        value = self.arena.constants[self.arena.values[index]]
+        return lambda frame: value
+
+    def compileVariable(self, index):
+        name = self.arena.values[index]
+        slot = self.resolver.slots[index]
+        if self.resolver.scopes[index] == LOCAL:
+            def variable(frame):
+                value = frame[slot]
+                if value is UNBOUND:
+                    undefined(name)
+                return value
+        else:
+            env = self.globals
+
+            def variable(frame):
+                value = env[slot]
+                if value is UNBOUND:
+                    undefined(name)
+                return value
+        return variable
+
+    def compileCall(self, index):
+        args = [self.compileExpression(self.arena.first[child]) for child in self.arena.children(index)]
+        if self.resolver.scopes[index] == LOCAL or len(args) > 3:
+            function = self.compileCallee(index)
+            return lambda frame: invoke(function(frame), [arg(frame) for arg in args])
+
+        # calls of global functions with up to three arguments read the
+        # function from its slot and, when it is a jutsu function of the
+        # right arity, build its frame from the arguments in place
+        slot = self.resolver.slots[index]
+        env = self.globals
+        callee = self.compileCallee(index)
+
+        if len(args) == 0:
+            def call(frame):
+                function = env[slot]
+                if function.__class__ is Function and function.arity == 0:
+                    result = function.body(function.padding[:])
+                    return result and (result[0] if len(result) == 1 else bounce(result))
+                return invoke(callee(frame), [])
+        elif len(args) == 1:
+            first, = args
+
+            def call(frame):
+                function = env[slot]
+                if function.__class__ is Function and function.arity == 1:
+                    result = function.body([first(frame), *function.padding])
+                    return result and (result[0] if len(result) == 1 else bounce(result))
+                return invoke(callee(frame), [first(frame)])
+        elif len(args) == 2:
+            first, second = args
+
+            def call(frame):
+                function = env[slot]
+                if function.__class__ is Function and function.arity == 2:
+                    result = function.body([first(frame), second(frame), *function.padding])
+                    return result and (result[0] if len(result) == 1 else bounce(result))
+                return invoke(callee(frame), [first(frame), second(frame)])
+        else:
+            first, second, third = args
+
+            def call(frame):
+                function = env[slot]
+                if function.__class__ is Function and function.arity == 3:
+                    result = function.body([first(frame), second(frame), third(frame), *function.padding])
+                    return result and (result[0] if len(result) == 1 else bounce(result))
+                return invoke(callee(frame), [first(frame), second(frame), third(frame)])
+        return call
+
+    def compileCallee(self, index):
+        """Return a closure that looks up the function called at index"""
+        if self.resolver.scopes[index] == LOCAL:
+            return self.compileVariable(index)
+        name = self.arena.values[index]
+        slot = self.resolver.slots[index]
+        env = self.globals
+
+        def callee(frame):
+            function = env[slot]
+            if function is UNBOUND:
+                if name not in builtins:
+                    undefined(name)
+                return builtins[name]
+            return function
+        return callee
+
+    statements = {
+        ASTNodeType.AssignStmt: compileAssignment,
+        ASTNodeType.ReturnStmt: compileReturn,
+        ASTNodeType.CallStmt: compilePrint,
+        ASTNodeType.IfStmt: compileIf
+    }
+
+    expressions = {
+        ASTNodeType.Expr: compileExpr,
+        ASTNodeType.BinaryOp: compileBinary,
+        ASTNodeType.UnaryOp: compileUnary,
+        ASTNodeType.IntegerConst: compileConstant,
+        ASTNodeType.StringConst: compileConstant,
+        ASTNodeType.BooleanConst: compileConstant,
+        ASTNodeType.Variable: compileVariable,
+        ASTNodeType.CallStmt: compileCall
+    }
+
 def process(ast, env):
-    return NotImplementedError
\ No newline at end of file
+    resolver = Resolver(ast.arena, env).resolve(ast.index)
+    pure = purity.analyze(resolver, ast.index) if env.memosize > 0 else ()
+    program = ClosureCompiler(resolver, pure).compileBody(ast.index)
+    result = program([])
+    if result is not None and len(result) == 2:
+        bounce(result)
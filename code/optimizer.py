@@ -0,0 +1,178 @@
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES, CONSTANTS
+from runtime import binaryops, augassigns
+
+# folded values larger than this many bits (or characters) are left to run
+# time, so a program like 9 ** 9 ** 9 does not hang the optimizer
+LIMIT = 4096
+
+# operators that always give a number when they succeed, whatever the
+# type of their operands
+NUMERIC = (Type.MINUS, Type.DIV, Type.IDIV, Type.DSTAR)
+
+class Optimizer:
+    """Simplify an AST in place before it is executed"""
+
+    def __init__(self, arena):
+        self.arena = arena
+        self.counts = {'folded': 0, 'simplified': 0, 'pruned': 0}
+
+    def kind(self, index):
+        return NODETYPES[self.arena.kinds[index]]
+
+    def children(self, index):
+        return list(self.arena.children(index))
+
+    def optimize(self, index):
+        # children are always optimized before their parent, by visiting
+        # the nodes in reverse preorder
+        order = []
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(self.arena.children(node))
+        for node in reversed(order):
+            kind = self.kind(node)
+            if kind == ASTNodeType.BinaryOp:
+                self.optimizeBinary(node)
+            elif kind == ASTNodeType.UnaryOp:
+                self.optimizeUnary(node)
+            elif kind == ASTNodeType.Body or kind == ASTNodeType.Node:
+                self.optimizeBody(node)
+        return self.counts
+
+    def constant(self, index):
+        """Return a 1-tuple of the value of a constant expression, or None"""
+        while self.kind(index) == ASTNodeType.Expr:
+            index = self.arena.first[index]
+        if self.arena.kinds[index] in CONSTANTS:
+            return (self.arena.constants[self.arena.values[index]],)
+        return None
+
+    def numeric(self, index):
+        """Check if an expression always gives an int or float (not a bool)"""
+        stack = [index]
+        while stack:
+            index = stack.pop()
+            while self.kind(index) == ASTNodeType.Expr:
+                index = self.arena.first[index]
+            kind = self.kind(index)
+            if kind == ASTNodeType.UnaryOp:
+                if self.arena.values[index] != Type.MINUS:
+                    return False
+            elif kind == ASTNodeType.BinaryOp:
+                op = self.arena.values[index]
+                op = augassigns.get(op, op)
+                if op == Type.PLUS or op == Type.MULT or op == Type.PERCENT:
+                    # these also work on strings, so both sides must be numbers
+                    stack.extend(self.arena.children(index))
+                elif op not in NUMERIC:
+                    return False
+            elif kind != ASTNodeType.IntegerConst:
+                return False
+        return True
+
+    def fold(self, index, value):
+        """Turn a node into the constant value, return False if it cannot hold it"""
+        if type(value) is bool:
+            kind = ASTNodeType.BooleanConst
+        elif type(value) is int and value.bit_length() <= LIMIT:
+            kind = ASTNodeType.IntegerConst
+        elif type(value) is str and len(value) <= LIMIT:
+            kind = ASTNodeType.StringConst
+        else:
+            # there is no float constant, so true division is left alone
+            return False
+        self.arena.kinds[index] = kind._value_
+        self.arena.values[index] = self.arena.pool.intern(value)
+        self.arena.first[index] = -1
+        self.arena.last[index] = -1
+        self.counts['folded'] += 1
+        return True
+
+    def replace(self, index, other):
+        """Turn a node into a copy of another node, keeping its siblings"""
+        arena = self.arena
+        arena.kinds[index] = arena.kinds[other]
+        arena.values[index] = arena.values[other]
+        arena.first[index] = arena.first[other]
+        arena.last[index] = arena.last[other]
+        self.counts['simplified'] += 1
+
+    def optimizeBinary(self, index):
+        op = self.arena.values[index]
+        op = augassigns.get(op, op)
+        left, right = self.children(index)
+        a, b = self.constant(left), self.constant(right)
+
+        if op == Type.OR or op == Type.AND:
+            # a constant left side decides which side the expression is
+            if a is not None:
+                self.replace(index, left if bool(a[0]) == (op == Type.OR) else right)
+            return
+
+        if a is not None and b is not None:
+            if self.cheap(op, a[0], b[0]):
+                try:
+                    value = binaryops[op](a[0], b[0])
+                except Exception:
+                    # errors such as 1 // 0 are still raised at run time
+                    return
+                self.fold(index, value)
+            return
+
+        # x + 0, 0 + x, x - 0, x * 1 and 1 * x, only where x is known to be
+        # a number, since True + 0 is 1 and "a" + 0 is an error
+        if b is not None and type(b[0]) is int and self.numeric(left):
+            if (op == Type.PLUS or op == Type.MINUS) and b[0] == 0 or op == Type.MULT and b[0] == 1:
+                self.replace(index, left)
+        elif a is not None and type(a[0]) is int and self.numeric(right):
+            if op == Type.PLUS and a[0] == 0 or op == Type.MULT and a[0] == 1:
+                self.replace(index, right)
+
+    def cheap(self, op, left, right):
+        """Check that folding op on two constants cannot blow up"""
+        if op == Type.DSTAR and type(left) is int and type(right) is int:
+            return right < 0 or max(left.bit_length(), 1) * right <= LIMIT
+        if op == Type.MULT and (type(left) is str or type(right) is str):
+            string, count = (left, right) if type(left) is str else (right, left)
+            return type(count) is not int or len(string) * count <= LIMIT
+        return True
+
+    def optimizeUnary(self, index):
+        a = self.constant(self.arena.first[index])
+        if a is None:
+            return
+        if self.arena.values[index] == Type.NOT:
+            self.fold(index, not a[0])
+        elif type(a[0]) is not str:
+            self.fold(index, -a[0])
+
+    def optimizeBody(self, index):
+        # drop if statements that never run, inline the bodies of those that
+        # always run, and drop expression statements that are only a constant
+        statements = []
+        changed = False
+        for child in self.arena.children(index):
+            kind = self.kind(child)
+            if kind == ASTNodeType.IfStmt:
+                test, body = self.children(child)
+                value = self.constant(test)
+                if value is not None:
+                    if value[0]:
+                        statements.extend(self.arena.children(body))
+                    self.counts['pruned'] += 1
+                    changed = True
+                    continue
+            elif kind == ASTNodeType.Expr and self.constant(child) is not None:
+                self.counts['pruned'] += 1
+                changed = True
+                continue
+            statements.append(child)
+        if changed:
+            self.arena.relink(index, statements)
+
+def optimize(ast):
+    """Optimize the AST under ast in place and return what was done"""
+    return Optimizer(ast.arena).optimize(ast.index)
@@ -1,5 +1,9 @@
-from tokenizer import Type, Token
+from tokenizer import Type, Token, unescape, escape
 from enum import Enum
+from array import array
+import io
+import json
+import sys
 
 class ASTNodeType(Enum):
     Argument = 1
@@ -24,56 +28,341 @@ class ASTNodeType(Enum):
     WhileStmt = 20
     Node = 21
 
+class Pool:
+    """Constants in the order they were added, and the index of each"""
+
+    def __init__(self, constants = ()):
+        self.constants = []
+        self.indices = {}
+        for value in constants:
+            self.intern(value)
+
+    def intern(self, value):
+        """Return the index of value in the pool, adding it if needed"""
+        # the type is part of the key so True and 1 get separate entries
+        key = (type(value), value)
+        index = self.indices.get(key)
+        if index is None:
+            index = self.indices[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+class Arena:
+    """Every node of an AST stored flat in parallel arrays, by node index"""
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.values = []
+        self.first = array('i')
+        self.last = array('i')
+        self.next = array('i')
+        # source line of every node, the line of the statement it is part
+        # of. nodes get the line the parser is at when they are added
+        self.lines = array('i')
+        self.line = 0
+        # decoded values of the constant nodes, which hold their index here
+        self.pool = Pool()
+        self.constants = self.pool.constants
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, nodetype, value = None):
+        """Add a node without children and return its index"""
+        # _value_ is what Enum.value returns, without the descriptor lookup
+        self.kinds.append(nodetype._value_)
+        self.values.append(value)
+        self.first.append(-1)
+        self.last.append(-1)
+        self.next.append(-1)
+        self.lines.append(self.line)
+        return len(self.kinds) - 1
+
+    def literal(self, index):
+        """Return the value of a node as it is dumped"""
+        value = self.values[index]
+        if self.kinds[index] in CONSTANTS:
+            value = self.constants[value]
+            if type(value) is str:
+                return escape(value)
+        return value
+
+    def link(self, parent, child):
+        """Append child to the children of parent"""
+        if self.first[parent] == -1:
+            self.first[parent] = child
+        else:
+            self.next[self.last[parent]] = child
+        self.last[parent] = child
+
+    def relink(self, parent, children):
+        """Replace the children of parent with a list of nodes"""
+        self.first[parent] = children[0] if children else -1
+        self.last[parent] = children[-1] if children else -1
+        for child, following in zip(children, children[1:]):
+            self.next[child] = following
+        if children:
+            self.next[children[-1]] = -1
+
+    def children(self, index):
+        """Yield the indices of the children of a node"""
+        child = self.first[index]
+        while child != -1:
+            yield child
+            child = self.next[child]
+
+    def write(self, file, index = 0):
+        """Write the subtree of a node to file, one indented line per node"""
+        stack = [(index, 0)]
+        while stack:
+            node, depth = stack.pop()
+            value = self.literal(node)
+            if value is not None:
+                file.write('\t' * depth + "{" + str(NODETYPES[self.kinds[node]]) + ", " + str(value) + "}\n")
+            else:
+                file.write('\t' * depth + "{" + str(NODETYPES[self.kinds[node]]) + "}\n")
+            children = list(self.children(node))
+            for child in reversed(children):
+                stack.append((child, depth + 1))
+
+    def writeJSON(self, file, index = 0):
+        """Write the subtree of a node to file as compact JSON"""
+        # every node is an array of its type, its value and its children,
+        # e.g. ["BinaryOp","PLUS",["Variable","a"],["IntegerConst",1]]
+        stack = [(index, '')]
+        while stack:
+            node, prefix = stack.pop()
+            if node == -1:
+                file.write(']')
+                continue
+            value = self.values[node]
+            if isinstance(value, Enum):
+                value = value.name
+            elif self.kinds[node] in CONSTANTS:
+                value = self.constants[value]
+            file.write(prefix + '[' + json.dumps(NODETYPES[self.kinds[node]].name) + ',' + json.dumps(value))
+            stack.append((-1, ''))
+            children = list(self.children(node))
+            for child in reversed(children):
+                stack.append((child, ','))
+
+    def node(self, index):
+        """Return an ASTNode view of a node"""
+        node = ASTNode.__new__(ASTNode)
+        node.arena = self
+        node.index = index
+        return node
+
+    def graft(self, node):
+        """Copy the subtree of a node from another arena and return its index"""
+        other = node.arena
+        root = self.copy(other, node.index)
+        stack = [(node.index, root)]
+        while stack:
+            source, target = stack.pop()
+            for child in other.children(source):
+                copy = self.copy(other, child)
+                self.link(target, copy)
+                stack.append((child, copy))
+        return root
+
+    def copy(self, other, index):
+        """Add a copy of a node of another arena, without its children"""
+        value = other.values[index]
+        if other.kinds[index] in CONSTANTS:
+            # constants are indices into the pool of their own arena
+            value = self.pool.intern(other.constants[value])
+        copy = self.add(NODETYPES[other.kinds[index]], value)
+        self.lines[copy] = other.lines[index]
+        return copy
+
+# ASTNodeType by kind code
+NODETYPES = (None, *ASTNodeType)
+
+# kind codes of the nodes whose value is an index into Arena.constants
+CONSTANTS = {ASTNodeType.IntegerConst._value_, ASTNodeType.StringConst._value_, ASTNodeType.BooleanConst._value_}
+
 class ASTNode:
     """Represent node in AST (Abstract Symbol Tree)"""
+
+    # a node is only a view of its index in an Arena, so it can be created
+    # and thrown away freely while the tree itself lives in the arena
+    __slots__ = ('arena', 'index')
     
-    def __init__(self, nodetype, value = None):
-        self.nodetype = nodetype
-        self.value = value
-        self.children = []
+    def __init__(self, nodetype, value = None, arena = None):
+        if arena is None:
+            arena = Arena()
+        self.arena = arena
+        self.index = arena.add(nodetype, value)
+        if nodetype._value_ in CONSTANTS:
+            arena.values[self.index] = arena.pool.intern(value)
+
+    def __eq__(self, other):
+        return isinstance(other, ASTNode) and self.arena is other.arena and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    @property
+    def nodetype(self):
+        return NODETYPES[self.arena.kinds[self.index]]
+
+    @nodetype.setter
+    def nodetype(self, nodetype):
+        self.arena.kinds[self.index] = nodetype._value_
+
+    @property
+    def value(self):
+        arena = self.arena
+        if arena.kinds[self.index] in CONSTANTS:
+            return arena.constants[arena.values[self.index]]
+        return arena.values[self.index]
+
+    @value.setter
+    def value(self, value):
+        if self.arena.kinds[self.index] in CONSTANTS:
+            value = self.arena.pool.intern(value)
+        self.arena.values[self.index] = value
+
+    @property
+    def children(self):
+        return [self.arena.node(child) for child in self.arena.children(self.index)]
 
     def __repr__(self):
-        if self.value is not None:
-            curr = "{" + str(self.nodetype) + ", " + str(self.value) + "}"
-        else:
-            curr = "{" + str(self.nodetype) + "}"
-
-        for c in self.children:
-            s = c.__repr__()
-            s = s.split('\n')
-            s = ['\t' + line for line in s]
-            s = '\n'.join(s)
-            curr += "\n" + s
-        return curr
+        out = io.StringIO()
+        self.arena.write(out, self.index)
+        return out.getvalue()[:-1]
 
     def push(self, node):
-        self.children.append(node)
+        if node.arena is not self.arena:
+            node = self.arena.node(self.arena.graft(node))
+        self.arena.link(self.index, node.index)
 
     def pop(self):
-        return self.children.pop()
+        arena = self.arena
+        last = arena.last[self.index]
+        if last == -1:
+            raise IndexError("pop from node without children")
+        if arena.first[self.index] == last:
+            arena.first[self.index] = -1
+            arena.last[self.index] = -1
+        else:
+            child = arena.first[self.index]
+            while arena.next[child] != last:
+                child = arena.next[child]
+            arena.next[child] = -1
+            arena.last[self.index] = child
+        return arena.node(last)
         
     def peek(self):
-        return self.children[-1]
+        last = self.arena.last[self.index]
+        if last == -1:
+            raise IndexError("peek at node without children")
+        return self.arena.node(last)
+
+class TokenBuffer:
+    """Lookahead over the TokenStores of a token stream"""
+
+    # the parser never looks more than one token back or two ahead, so
+    # only the stores holding the most recent tokens are kept
+    def __init__(self, stores, size = 8):
+        self.stores = iter(stores)
+        self.windows = []
+        self.size = size
+        self.store = None
+        self.base = self.end = 0
+        self.done = False
+
+    def __getitem__(self, index):
+        store, position = self.locate(index)
+        return store[position]
+
+    def locate(self, index):
+        """Return the store holding the token at index and its position in it"""
+        if self.base <= index < self.end:
+            return self.store, index - self.base
+        while index >= self.end and not self.done:
+            self.fill()
+        if index >= self.end:
+            # the stream ends with EOF, which the parser never reads past,
+            # but keep returning it in case it peeks beyond the end
+            index = self.end - 1
+        for base, store in reversed(self.windows):
+            if index >= base:
+                return store, index - base
+        raise Exception("Token %d is no longer in the lookahead buffer" % index)
+
+    def fill(self):
+        """Pull the next store from the stream, dropping the ones out of reach"""
+        store = next(self.stores, None)
+        if store is None:
+            self.done = True
+            return
+        if not len(store):
+            return
+        self.windows = [(base, kept) for base, kept in self.windows if base + len(kept) > self.end - self.size]
+        self.windows.append((self.end, store))
+        self.store = store
+        self.base = self.end
+        self.end += len(store)
+
+    def kind(self, index):
+        """Type of the token at index"""
+        store, position = self.locate(index)
+        return store.kind(position)
+
+    def value(self, index):
+        """Value of the token at index"""
+        store, position = self.locate(index)
+        return store.value(position)
+
+    def line(self, index):
+        """Line of the token at index"""
+        store, position = self.locate(index)
+        return store.line(position)
+
 class Parser:
 
-    atommap = {
-        Type.INT: ASTNodeType.IntegerConst,
-        Type.STRING: ASTNodeType.StringConst,
-        Type.NAME: ASTNodeType.Variable,
-        Type.TRUE: ASTNodeType.BooleanConst,
-        Type.FALSE: ASTNodeType.BooleanConst
+    # binding power of the binary operators, higher binds tighter
+    precedence = {
+        Type.OR: 1,
+        Type.AND: 2,
+        Type.DEQ: 4,
+        Type.NEQ: 4,
+        Type.LEQ: 4,
+        Type.LT: 4,
+        Type.GEQ: 4,
+        Type.GT: 4,
+        Type.PLUS: 5,
+        Type.MINUS: 5,
+        Type.MULT: 6,
+        Type.DIV: 6,
+        Type.IDIV: 6,
+        Type.PERCENT: 6,
+        Type.DSTAR: 8
     }
 
+    # binding power of the prefix '!' and '-'
+    inversion = 3
+    negation = 7
+
+    assignops = (Type.EQ, Type.PLUSEQ, Type.MINUSEQ, Type.MULTEQ, Type.DIVEQ, Type.IDIVEQ, Type.DSTAREQ)
+
     def __init__(self, tokens):
+        # tokens can be a TokenStore or a TokenBuffer, which both expose
+        # kind/value/line by index
         self.tokens = tokens
         self.current = 0
-        self.backtrack = 0
+        self.bodies = []
+        self.arena = Arena()
 
         try:
             self.parseProgram()
         except Exception as e:
             print("Exception during parsing:")
             print(e)
+            # a partial tree must never reach the executors
+            self.ast = None
 
     def next(self) -> Token:
         """Peek the next token"""
@@ -85,7 +374,7 @@ class Parser:
     
     def atEnd(self):
         """Check if we are at end of file"""
-        return self.next().type == Type.EOF
+        return self.tokens.kind(self.current) == Type.EOF
 
     def consume(self) -> Token:
         """Consume a token"""
@@ -95,9 +384,8 @@ class Parser:
     
     def check(self, type):
         """Checks if next token is of a certain type"""
-        if self.atEnd():
-            return False
-        return self.next().type == type
+        kind = self.tokens.kind(self.current)
+        return kind == type and kind != Type.EOF
 
     def expect(self, type):
         """Expects next token to be of a certain type"""
@@ -107,30 +395,37 @@ class Parser:
         
     def accept(self, *types):
         """Accept and consume any type in types for the next token"""
-        for type in types:
-            if self.check(type):
-                self.consume()
-                return True
+        if self.tokens.kind(self.current) in types:
+            self.current += 1
+            return True
         return False
     
-    def save(self):
-        self.backtrack = self.current
-    
-    def restore(self):
-        self.current = self.backtrack
+    def node(self, nodetype, value = None):
+        """Create a node in the arena of this parser and return its index"""
+        return self.arena.add(nodetype, value)
+
+    def name(self, index):
+        """Return the name at token index, as one shared string per name"""
+        # interned names compare and hash as fast as the lookups of the
+        # resolver and the backends can go, by identity first
+        return sys.intern(self.tokens.value(index))
 
     def error(self):
-        raise Exception("Error while parsing token %s at line %d" % (self.next(), self.next().line))
+        raise Exception("Error while parsing token %s at line %d" % (self.next(), self.tokens.line(self.current)))
     
     def parseProgram(self):
         """Parse program"""
         # program:
         # | [stmt+] EOF
-        self.ast = ASTNode(ASTNodeType.Node)
+        # the program node is always index 0, so the index of any other
+        # node is truthy and a rule can return None when nothing matched
+        root = self.node(ASTNodeType.Node)
+        self.ast = self.arena.node(root)
         while not self.atEnd():
             node = self.parseStatement()
             if node:
-                self.ast.push(node)
+                self.arena.link(root, node)
+                self.parseBodyPrime()
             if not self.atEnd() and not self.accept(Type.NEWLINE):
                 self.error()
 
@@ -138,65 +433,38 @@ class Parser:
         # stmt:
         # | simple_stmt
         # | compound_stmt
-        self.save()
-        node = self.parseSimpleStatement()
-        if node:
-            return node
-        else:
-            self.restore()
-        
-        node = self.parseCompoundStatement()
-        if node:
-            return node
-        else:
-            self.restore()
-        
-    def parseSimpleStatement(self):
-        # simple_stmt:
-        # | assignment
-        # | expression
-        # | return_stmt
-        # | print_stmt
-
-        self.save()
-        node = self.parseAssignment()
-        if node:
-            return node
-        
-        self.restore()
-        node = self.parseExpression()
-        if node:
-            return node
-        
-        self.restore()
-        node = self.parseReturnStatement()
-        if node:
-            return node
-        
-        self.restore()
-        node = self.parsePrintStatement()
-        if node:
-            return node
-    
+
+        # every statement starts with a different token, except assignments
+        # and expressions which both start with NAME and are told apart by
+        # the token after it. the statement is then parsed in a single pass
+        kind = self.tokens.kind(self.current)
+        self.arena.line = self.tokens.line(self.current)
+        if kind == Type.NAME and self.tokens.kind(self.current + 1) in self.assignops:
+            return self.parseAssignment()
+        rule = self.statements.get(kind)
+        if rule:
+            return rule(self)
+        return self.parseExpression()
+
     def parseAssignment(self):
         # assignment:
         # NAME '=' expression
         # NAME augassign expression
-        var = self.expect(Type.NAME)
-        if var:
-            node = ASTNode(ASTNodeType.AssignStmt)
-            varnode = ASTNode(ASTNodeType.Variable, var.value)
-            node.push(var)
-            if self.accept(Type.EQ):
-                node.push(self.parseExpression())
-                return node
-            else:
-                op = self.parseAugAssign()
-                if op:
-                    op.push(varnode)
-                    op.push(self.parseExpression())
-                    node.push(op)
-                    return node
+        self.current += 1
+        name = self.name(self.current - 1)
+        node = self.node(ASTNodeType.AssignStmt)
+        self.arena.link(node, self.node(ASTNodeType.Variable, name))
+        if self.accept(Type.EQ):
+            target = node
+        else:
+            target = self.parseAugAssign()
+            self.arena.link(target, self.node(ASTNodeType.Variable, name))
+            self.arena.link(node, target)
+        expr = self.parseExpression()
+        if not expr:
+            self.error()
+        self.arena.link(target, expr)
+        return node
 
     def parseAugAssign(self):
         # augassign:
@@ -207,296 +475,230 @@ class Parser:
         # | '//=' 
         # | '**='
         if self.accept(Type.PLUSEQ, Type.MINUSEQ, Type.MULTEQ, Type.DIVEQ, Type.IDIVEQ, Type.DSTAREQ):
-            return ASTNode(ASTNodeType.BinaryOp, self.previous().type)
+            return self.node(ASTNodeType.BinaryOp, self.tokens.kind(self.current - 1))
 
     def parseReturnStatement(self):
         # return_stmt:
         # 'release' expression
-        if self.expect(Type.RETURN):
-            node = ASTNode(ASTNodeType.ReturnStmt)
-            expr = self.parseExpression()
-            node.push(expr)
-            return node
+        self.consume()
+        node = self.node(ASTNodeType.ReturnStmt)
+        expr = self.parseExpression()
+        if expr:
+            self.arena.link(node, expr)
+        return node
         
     def parsePrintStatement(self):
         # print_stmt:
         # 'print' expression
-        if self.expect(Type.PRINT):
-            node = ASTNode(ASTNodeType.CallStmt, self.previous().type)
-            expr = self.parseExpression()
-            node.push(expr)
-            return node
-
-    def parseCompoundStatement(self):
-        # compound_stmt:
-        # | function_def
-        # | if_stmt
-        self.save()
-        node = self.parseFunctionDefinition()
-        if node:
-            return node
-        
-        self.restore()
-        node = self.parseIfStatement()
-        if node:
-            return node
+        node = self.node(ASTNodeType.CallStmt, self.consume().type)
+        expr = self.parseExpression()
+        if not expr:
+            self.error()
+        self.arena.link(node, expr)
+        return node
 
     def parseFunctionDefinition(self):
         # function_def:
         # | 'jutsu' NAME '(' NAME* ')' body
-        if self.expect(Type.DEFINE):
-            if self.expect(Type.NAME):
-                func_def = ASTNode(ASTNodeType.AssignStmt, self.previous().value)
-                if self.expect(Type.LPAREN):
-                    num_args = 0
-                    num_commas = 0
-                    while not self.accept(Type.RPAREN):
-                        varname = self.expect(Type.NAME)
-                        if varname:
-                            num_args += 1
-                            arg = ASTNode(ASTNodeType.VarDecl, varname)
-                            func_def.push(arg)
-                        else:
-                            return
-
-                        if self.accept(Type.COMMA):
-                            num_commas += 1
-
-                    if num_args > 0 and num_commas != num_args - 1:
-                        self.error()
-                        return
-                    
-                    body = self.parseBody()
-                    func_def.push(body)
-                    return func_def
-            
+        self.consume()
+        if not self.expect(Type.NAME) or not self.expect(Type.LPAREN):
+            self.error()
+        func_def = self.node(ASTNodeType.AssignStmt, self.name(self.current - 2))
+        num_args = 0
+        num_commas = 0
+        while not self.accept(Type.RPAREN):
+            varname = self.expect(Type.NAME)
+            if not varname:
+                self.error()
+            num_args += 1
+            arg = self.node(ASTNodeType.VarDecl, sys.intern(varname.value))
+            self.arena.link(func_def, arg)
+
+            if self.accept(Type.COMMA):
+                num_commas += 1
+
+        if num_args > 0 and num_commas != num_args - 1:
+            self.error()
+
+        self.arena.link(func_def, self.parseBody())
+        return func_def
 
     def parseIfStatement(self):
         # if_statement:
         # | 'if' expression body
-        if self.expect(Type.IF):
-            expr = self.parseExpression()
-            body = self.parseBody()
-            node = ASTNode(ASTNodeType.IfStmt)
-            if expr:
-                node.push(expr)
-            if body:
-                node.push(body)
-            return node
+        self.consume()
+        expr = self.parseExpression()
+        if not expr:
+            self.error()
+        node = self.node(ASTNodeType.IfStmt)
+        self.arena.link(node, expr)
+        self.arena.link(node, self.parseBody())
+        return node
     
     def parseBody(self):
         # body:
         # | '{' body_prime
-        if self.expect(Type.LCB):
-            node = ASTNode(ASTNodeType.Body)
-            self.parseBodyPrime(node)
-            return node
+
+        # the body is only opened here, its statements are parsed by
+        # parseBodyPrime once the statement that owns it is complete
+        if not self.expect(Type.LCB):
+            self.error()
+        node = self.node(ASTNodeType.Body)
+        self.bodies.append(node)
+        return node
     
-    def parseBodyPrime(self, node):
+    def parseBodyPrime(self):
         # body_prime:
         # | statement NEWLINE body_prime
         # | '}'
-        if not self.accept(Type.RCB):
+
+        # statements go into the innermost open body. a statement with a
+        # body of its own opens it on top of the stack and '}' closes it,
+        # so nested bodies are parsed in a loop instead of by recursion
+        bodies = self.bodies
+        while bodies:
+            if self.accept(Type.RCB):
+                bodies.pop()
+                continue
+            body = bodies[-1]
             statement = self.parseStatement()
-            if statement:
-                self.accept(Type.NEWLINE)
-                node.push(statement)
-                self.parseBodyPrime(node)
+            if not statement:
+                self.error()
+            self.accept(Type.NEWLINE)
+            self.arena.link(body, statement)
 
     def parseExpression(self):
         # expression:
         # | disjunction
         disj = self.parseDisjunction()
         if disj:
-            node = ASTNode(ASTNodeType.Expr)
-            node.push(disj)
+            node = self.node(ASTNodeType.Expr)
+            self.arena.link(node, disj)
             return node
 
     def parseDisjunction(self):
         # disjunction:
         # | conjunction ('or' conjunction)*
-        conj = self.parseConjunction()
-        if self.accept(Type.OR):
-            node = ASTNode(ASTNodeType.BinaryOp, 'Or')
-            right_conj = self.parseConjunction()
-            node.push(conj)
-            node.push(right_conj)
-
-            while self.accept(Type.OR):
-                outer_node = ASTNode(ASTNodeType.BinaryOp, 'Or')
-                right_conj = self.parseConjunction()
-                outer_node.push(node)
-                outer_node.push(right_conj)
-                node = outer_node
-            return node
-        else:
-            return conj
-
-    def parseConjunction(self):
         # conjunction:
         # | inversion ('and' inversion)*
-        inv = self.parseInversion()
-        if self.accept(Type.AND):
-            node = ASTNode(ASTNodeType.BinaryOp, 'And')
-            right_inv = self.parseInversion()
-            node.push(inv)
-            node.push(right_inv)
-
-            while self.accept(Type.AND):
-                outer_node = ASTNode(ASTNodeType.BinaryOp, 'And')
-                right_inv = self.parseInversion()
-                outer_node.push(node)
-                outer_node.push(right_inv)
-                node = outer_node
-            return node
-        else:
-            return inv
-
-    def parseInversion(self):
         # inversion:
         # | '!' inversion 
         # | comparison
-        if self.accept(Type.NOT):
-            node = ASTNode(ASTNodeType.UnaryOp, self.previous().type)
-            node.push(self.parseInversion())
-            return node
-        return self.parseComparison()
-    
-    def parseComparison(self):
         # comparison:
         # | sum (compare_op sum)*
-        return_op = self.parseSum()
-        compare_op = self.parseComparisonOperator()
-        while(compare_op):
-            compare_op.push(return_op)
-            compare_op.push(self.parseSum())
-            return_op = compare_op
-            compare_op = self.parseComparisonOperator()
-        return return_op
-    
-    def parseComparisonOperator(self):
-        # compare_op:
-        # | '=='
-        # | '!='
-        # | '<='
-        # | '<'
-        # | '>='
-        # | '>'
-        if self.accept(Type.DEQ, Type.NEQ, Type.LEQ, Type.LT, Type.GEQ, Type. GT):
-            return ASTNode(ASTNodeType.BinaryOp, self.previous().type)
-
-    def parseSum(self):
         # sum:
-        # | sum '+' term
-        # | sum '-' term
+        # | sum ('+' | '-') term
         # | term
-
-        # Actual Implementation (Right Recursive)
-
-        # sum:
-        # | term sum_prime
-        term = self.parseTerm()
-        op_prime = self.parseSumPrime()
-        if op_prime:
-            op_prime.push(term)
-            return op_prime
-        return term
-    
-    def parseSumPrime(self):
-        # sum_prime:
-        # | e
-        # | '+' term sum_prime
-        # | '-' term sum_prime
-        if self.accept(Type.PLUS, Type.MINUS):
-            node = ASTNode(ASTNodeType.BinaryOp, self.previous().type)
-            term = self.parseTerm()
-            sum_prime = self.parseSumPrime()
-            if sum_prime:
-                sum_prime.push(term)
-                node.push(sum_prime)
-            else:
-                node.push(term)
-            return node
-        
-    def parseTerm(self):
         # term:
-        # term '*' factor
-        # term '/' factor
-        # term '//' factor
-        # term '%' factor
-        # factor
-
-        # Actual Implementation (Right Recursive)
-        # term:
-        # factor term_prime
-        factor = self.parseFactor()
-        term_prime = self.parseTermPrime()
-        if term_prime:
-            term_prime.push(factor)
-            return term_prime
-        return factor
-    
-    def parseTermPrime(self):
-        # term_prime:
-        # | e
-        # | '*' factor term_prime
-        # | '/' factor term_prime
-        # | '//' factor term_prime
-        # | '%' factor term_prime
-        if self.accept(Type.MULT, Type.DIV, Type.IDIV, Type.PERCENT):
-            node = ASTNode(ASTNodeType.BinaryOp, self.previous().type)
-            factor = self.parseFactor()
-            term_prime = self.parseTermPrime()
-            if term_prime:
-                term_prime.push(factor)
-                node.push(term_prime)
-            else:
-                node.push(factor)
-            return node
-        
-    def parseFactor(self):
+        # | term ('*' | '/' | '//' | '%') factor
+        # | factor
         # factor:
         # | '-' factor
         # | power
-        if self.accept(Type.MINUS):
-            node = ASTNode(ASTNodeType.UnaryOp, self.previous().type)
-            node.push(self.parseFactor())
-            return node
-        return self.parsePower()
-    
-    def parsePower(self):
         # power:
         # | primary '**' factor
         # | primary
-        atom = self.parsePrimary()
-        if self.accept(Type.DSTAR):
-            node = ASTNode(ASTNodeType.BinaryOp, self.previous().type)
-            node.push(atom)
-            node.push(self.parseFactor())
-            return node
-        return atom
+        # atom:
+        # | '(' expression ')'
+
+        # all of the rules above are parsed by one loop (precedence
+        # climbing). operands and pending operators are kept on explicit
+        # stacks; before an operator is pushed, every pending operator that
+        # binds at least as tightly is applied, which makes the binary
+        # operators left associative ('**' only applies the ones that bind
+        # tighter, so it is right associative). '!' is a prefix operator
+        # between 'and' and the comparisons, and '-' one between the
+        # products and '**'. an opening parenthesis is a marker on the
+        # operator stack that no operator is applied past, so nested
+        # parentheses never recurse
+        operands = []
+        operators = []
+        depth = 0
+        while True:
+            # a factor, after '-' or '**', cannot start with '!' unless it
+            # is in parentheses
+            factor = bool(operators) and operators[-1][1] == Type.DSTAR
+            while True:
+                if not factor and self.accept(Type.NOT):
+                    operators.append((self.inversion, Type.NOT, True))
+                elif self.accept(Type.MINUS):
+                    operators.append((self.negation, Type.MINUS, True))
+                    factor = True
+                elif self.accept(Type.LPAREN):
+                    operators.append((0, Type.LPAREN, True))
+                    depth += 1
+                    factor = False
+                else:
+                    break
+            operand = self.parsePrimary()
+            if not operand:
+                if operands or operators:
+                    self.error()
+                return
+            operands.append(operand)
+
+            # what a pair of parentheses enclosed becomes an Expr
+            while depth and self.accept(Type.RPAREN):
+                while operators[-1][1] != Type.LPAREN:
+                    self.reduce(operands, operators)
+                operators.pop()
+                depth -= 1
+                node = self.node(ASTNodeType.Expr)
+                self.arena.link(node, operands[-1])
+                operands[-1] = node
+
+            kind = self.tokens.kind(self.current)
+            precedence = self.precedence.get(kind)
+            if precedence is None:
+                break
+            self.current += 1
+            if kind == Type.DSTAR:
+                while operators and operators[-1][0] > precedence:
+                    self.reduce(operands, operators)
+            else:
+                while operators and operators[-1][0] >= precedence:
+                    self.reduce(operands, operators)
+            operators.append((precedence, kind, False))
+
+        if depth:
+            self.error()
+        while operators:
+            self.reduce(operands, operators)
+        return operands[0]
+
+    def reduce(self, operands, operators):
+        """Apply the topmost pending operator to the topmost operands"""
+        _, kind, prefix = operators.pop()
+        if prefix:
+            node = self.node(ASTNodeType.UnaryOp, kind)
+            self.arena.link(node, operands[-1])
+            operands[-1] = node
+        else:
+            right = operands.pop()
+            node = self.node(ASTNodeType.BinaryOp, kind)
+            self.arena.link(node, operands[-1])
+            self.arena.link(node, right)
+            operands[-1] = node
     
     def parsePrimary(self):
         # primary:
         # | NAME '(' (expression | (expression ',')+) ')'
         # | atom
         if self.accept(Type.NAME):
-            func_name = self.previous().value
+            func_name = self.name(self.current - 1)
             if self.accept(Type.LPAREN):
-                node = ASTNode(ASTNodeType.CallStmt, func_name)
+                node = self.node(ASTNodeType.CallStmt, func_name)
                 while not self.accept(Type.RPAREN):
-                    arg = ASTNode(ASTNodeType.Argument)
+                    arg = self.node(ASTNodeType.Argument)
                     expr = self.parseExpression()
-                    if expr:
-                        arg.push(expr)
-                        node.push(arg)
-                    else:
-                        # could also error here
-                        return
+                    if not expr:
+                        self.error()
+                    self.arena.link(arg, expr)
+                    self.arena.link(node, arg)
                     
                     self.accept(Type.COMMA)
                 return node
-            return ASTNode(ASTNodeType.Variable, func_name)
+            return self.node(ASTNodeType.Variable, func_name)
         return self.parseAtom()
 
     def parseAtom(self):
@@ -506,35 +708,27 @@ class Parser:
         # | NAME
         # | TRUE
         # | FALSE
-        # | '(' expression ')'
-        if self.accept(Type.INT, Type.STRING, Type.NAME):
-            return ASTNode(self.atommap[self.previous().type], self.previous().value)
+        # parenthesised expressions are parsed by parseDisjunction
+        # literals are decoded here, once, into the constant pool
+        if self.accept(Type.INT):
+            return self.node(ASTNodeType.IntegerConst, self.arena.pool.intern(int(self.tokens.value(self.current - 1))))
+        elif self.accept(Type.STRING):
+            return self.node(ASTNodeType.StringConst, self.arena.pool.intern(unescape(self.tokens.value(self.current - 1))))
+        elif self.accept(Type.NAME):
+            return self.node(ASTNodeType.Variable, self.name(self.current - 1))
         elif self.accept(Type.TRUE):
-            return ASTNode(self.atommap[self.previous().type], 1)
+            return self.node(ASTNodeType.BooleanConst, self.arena.pool.intern(True))
         elif self.accept(Type.FALSE):
-            return ASTNode(self.atommap[self.previous().type], 0)
-        elif self.accept(Type.LPAREN):
-            expr = self.parseExpression()
-            if expr and self.accept(Type.RPAREN):
-                return expr
+            return self.node(ASTNodeType.BooleanConst, self.arena.pool.intern(False))
     
     def parseListBody(self):
         # TODO add list body parsing logic
-        raise NotImplementedError           
-
-    def parseArgs(self):
-        self.consume() # skip left parentheses
-        node = ASTNode("Args", "")
-        if self.accept(Type.RPAREN): # no argument case
-            return node
-
-        # parse first argument
-        node.push(self.parseExpression())
-
-        # if there are more arguments, will be in comma separated list
-        while self.accept(Type.COMMA):
-            node.push(self.parseExpression())
-            
-        # if the token is not a comma, it should be the end of the list
-        self.expect(Type.RPAREN)
-        return node
\ No newline at end of file
+        raise NotImplementedError
+
+    # statement rule by the type of its first token
+    statements = {
+        Type.RETURN: parseReturnStatement,
+        Type.PRINT: parsePrintStatement,
+        Type.DEFINE: parseFunctionDefinition,
+        Type.IF: parseIfStatement
+    }
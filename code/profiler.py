@@ -0,0 +1,82 @@
+import time
+
+class Profiler:
+    """Count calls, self and total time of jutsu functions and hits of source lines"""
+
+    # the backends call enter when a function body starts running, exit
+    # when it stops and hit before every statement. the time between two
+    # of these events goes to the function on top of the stack, and to
+    # the stack as a whole for the collapsed stacks. a released call runs
+    # after the function that released it has exited, so it shows up next
+    # to it instead of inside it, and a call answered by the result cache
+    # of a pure function never runs its body and is not counted
+
+    def __init__(self):
+        # calls, self time and total time by function name
+        self.functions = {}
+        self.lines = {}
+        # time by the names on the stack joined with ';'
+        self.stacks = {}
+        self.stack = []
+        # running calls by function name, a recursive call is only added
+        # to the total of its function once, by the outermost call
+        self.running = {}
+        self.path = 'program'
+        self.last = time.perf_counter()
+
+    def start(self):
+        """Start timing, the time before belongs to no function"""
+        self.last = time.perf_counter()
+
+    def stop(self):
+        """Exit every function still running after an error and stop timing"""
+        while self.stack:
+            self.exit()
+        self.charge(time.perf_counter())
+
+    def charge(self, now):
+        """Add the time since the last event to the running function"""
+        elapsed = now - self.last
+        self.last = now
+        self.stacks[self.path] = self.stacks.get(self.path, 0.0) + elapsed
+        if self.stack:
+            self.functions[self.stack[-1][0]][1] += elapsed
+
+    def enter(self, name):
+        now = time.perf_counter()
+        self.charge(now)
+        counts = self.functions.get(name)
+        if counts is None:
+            counts = self.functions[name] = [0, 0.0, 0.0]
+        counts[0] += 1
+        self.stack.append((name, now, self.path))
+        self.path += ';' + name
+        self.running[name] = self.running.get(name, 0) + 1
+
+    def exit(self):
+        now = time.perf_counter()
+        self.charge(now)
+        name, start, self.path = self.stack.pop()
+        self.running[name] -= 1
+        if not self.running[name]:
+            self.functions[name][2] += now - start
+
+    def hit(self, line):
+        self.lines[line] = self.lines.get(line, 0) + 1
+
+    def table(self, file):
+        """Write the functions by self time and the lines by hits to file"""
+        file.write("%10s %12s %12s  %s\n" % ("calls", "self ms", "total ms", "function"))
+        for name, (calls, own, total) in sorted(self.functions.items(), key = lambda item: -item[1][1]):
+            file.write("%10d %12.3f %12.3f  %s\n" % (calls, own * 1000, total * 1000, name))
+        file.write("\n%10s  %s\n" % ("hits", "line"))
+        for line, hits in sorted(self.lines.items(), key = lambda item: (-item[1], item[0])):
+            file.write("%10d  %d\n" % (hits, line))
+
+    def collapsed(self, file):
+        """Write the time of every stack in microseconds, one 'a;b;c time' line each"""
+        # the collapsed stack format read by flamegraph.pl and speedscope
+        for path, seconds in sorted(self.stacks.items()):
+            micros = round(seconds * 1e6)
+            if micros:
+                file.write("%s %d\n" % (path, micros))
@@ -0,0 +1,78 @@
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES
+from runtime import builtins
+from resolver import GLOBAL
+
+class Purity:
+    """Find the jutsu functions whose result only depends on their arguments"""
+
+    # a function is pure when it never prints, never assigns a global or
+    # defines a function, only reads globals that are functions and only
+    # calls pure functions or builtins. a global name only counts as a
+    # function when its one and only binding is a top level definition
+
+    def __init__(self, resolver):
+        self.arena = resolver.arena
+        self.resolver = resolver
+
+    def kind(self, index):
+        return NODETYPES[self.arena.kinds[index]]
+
+    def analyze(self, index):
+        """Return the node indices of the pure function definitions"""
+        bindings = {}
+        definitions = {}
+        stack = [(index, True)]
+        while stack:
+            node, top = stack.pop()
+            if self.kind(node) == ASTNodeType.AssignStmt:
+                name = self.arena.values[node]
+                target = node if name is not None else self.arena.first[node]
+                if self.resolver.scopes[target] == GLOBAL:
+                    name = self.arena.values[target]
+                    bindings[name] = bindings.get(name, 0) + 1
+                    if target == node and top:
+                        definitions[name] = node
+                top = top and target != node
+            stack.extend((child, top) for child in self.arena.children(node))
+        functions = {name: node for name, node in definitions.items() if bindings[name] == 1}
+
+        # drop functions that call impure ones until no more can be dropped
+        calls = {node: self.calls(node, functions, bindings) for node in functions.values()}
+        pure = {node for node, callees in calls.items() if callees is not None}
+        changed = True
+        while changed:
+            changed = False
+            for node in list(pure):
+                if not calls[node] <= pure:
+                    pure.discard(node)
+                    changed = True
+        return pure
+
+    def calls(self, definition, functions, bindings):
+        """Return the functions a definition calls, or None if it is impure"""
+        callees = set()
+        stack = [self.arena.last[definition]]
+        while stack:
+            node = stack.pop()
+            kind = self.kind(node)
+            name = self.arena.values[node]
+            if kind == ASTNodeType.AssignStmt:
+                if name is not None or self.resolver.scopes[self.arena.first[node]] == GLOBAL:
+                    return None
+            elif kind == ASTNodeType.CallStmt:
+                if name == Type.PRINT or self.resolver.scopes[node] != GLOBAL:
+                    return None
+                if name in functions:
+                    callees.add(functions[name])
+                elif name in bindings or name not in builtins:
+                    return None
+            elif kind == ASTNodeType.Variable:
+                if self.resolver.scopes[node] == GLOBAL and name not in functions:
+                    return None
+            stack.extend(self.arena.children(node))
+        return callees
+
+def analyze(resolver, index):
+    """Return the pure function definitions under index of a resolved AST"""
+    return Purity(resolver).analyze(index)
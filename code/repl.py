@@ -0,0 +1,45 @@
+from tokenizer import Tokenizer, TokenStore
+
+class Session:
+    """An interactive session that runs its input one complete fragment at a time"""
+
+    # lines are buffered until every brace and string they open is closed,
+    # then only that fragment is parsed and compiled. globals and compiled
+    # functions live on in the Globals of the session, so the work for a
+    # fragment does not grow with the history before it
+
+    def __init__(self, execute):
+        # execute runs the source of one fragment
+        self.execute = execute
+        self.lines = []
+
+    def pending(self):
+        """Check if the buffered lines still need more input"""
+        return bool(self.lines)
+
+    def feed(self, line):
+        """Add a line of input, run the fragment if it is complete"""
+        self.lines.append(line)
+        source = '\n'.join(self.lines)
+        if self.open(source):
+            return False
+        self.lines = []
+        if source.strip():
+            self.execute(source)
+        return True
+
+    def reset(self):
+        """Drop the buffered lines"""
+        self.lines = []
+
+    def open(self, source):
+        """Check if source leaves a brace or string open"""
+        tokenizer = Tokenizer(source)
+        try:
+            # the scan stops early at a string without its closing quote
+            if tokenizer.scan(source, 0, len(source), False, TokenStore(source)) < len(source):
+                return True
+        except Exception:
+            # errors are reported when the fragment is run
+            return False
+        return tokenizer.level > 0
@@ -0,0 +1,55 @@
+from array import array
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES
+from runtime import assigned
+
+# scope of a resolved name
+LOCAL = 1
+GLOBAL = 2
+
+class Resolver:
+    """Give every variable a numbered slot, in its function frame or in the globals"""
+
+    # names assigned or declared as parameters in a function body are local
+    # to it, every other name is global. slots of the globals come from
+    # the Globals of the program so they stay the same across REPL lines
+
+    def __init__(self, arena, env):
+        self.arena = arena
+        self.env = env
+        # scope and slot of every Variable, named CallStmt and function
+        # definition by node index
+        self.scopes = array('B', bytes(len(arena)))
+        self.slots = array('i', bytes(4 * len(arena)))
+        # names of the local slots of every function definition
+        self.frames = {}
+
+    def resolve(self, index):
+        stack = [(index, None)]
+        while stack:
+            node, scope = stack.pop()
+            kind = NODETYPES[self.arena.kinds[node]]
+            name = self.arena.values[node]
+            if kind == ASTNodeType.AssignStmt and name is not None:
+                # a function definition binds its name in the scope around it
+                # and opens a scope of its own: parameters first, then locals
+                self.bind(node, name, scope)
+                children = list(self.arena.children(node))
+                params = [self.arena.values[child] for child in children[:-1]]
+                locals = params + sorted(assigned(self.arena, children[-1]) - set(params))
+                self.frames[node] = locals
+                stack.append((children[-1], {local: slot for slot, local in enumerate(locals)}))
+                continue
+            if kind == ASTNodeType.Variable or (kind == ASTNodeType.CallStmt and name != Type.PRINT):
+                self.bind(node, name, scope)
+            stack.extend((child, scope) for child in self.arena.children(node))
+        return self
+
+    def bind(self, node, name, scope):
+        """Resolve name at node in the innermost function scope or the globals"""
+        if scope is not None and name in scope:
+            self.scopes[node] = LOCAL
+            self.slots[node] = scope[name]
+        else:
+            self.scopes[node] = GLOBAL
+            self.slots[node] = self.env.slot(name)
@@ -0,0 +1,186 @@
+import operator
+from collections import OrderedDict
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES
+
+# python operator for every binary operator and augmented assignment,
+# '/' is true division as in python
+binaryops = {
+    Type.PLUS: operator.add,
+    Type.MINUS: operator.sub,
+    Type.MULT: operator.mul,
+    Type.DIV: operator.truediv,
+    Type.IDIV: operator.floordiv,
+    Type.PERCENT: operator.mod,
+    Type.DSTAR: operator.pow,
+    Type.DEQ: operator.eq,
+    Type.NEQ: operator.ne,
+    Type.LT: operator.lt,
+    Type.GT: operator.gt,
+    Type.LEQ: operator.le,
+    Type.GEQ: operator.ge
+}
+
+# binary operator applied by each augmented assignment
+augassigns = {
+    Type.PLUSEQ: Type.PLUS,
+    Type.MINUSEQ: Type.MINUS,
+    Type.MULTEQ: Type.MULT,
+    Type.DIVEQ: Type.DIV,
+    Type.IDIVEQ: Type.IDIV,
+    Type.DSTAREQ: Type.DSTAR
+}
+
+# operator chains longer than this are not nested by the backends, so very
+# long generated expressions do not hit the recursion limit
+CHAIN = 32
+
+# functions every program can call without defining them
+builtins = {
+    'len': len,
+    'str': str,
+    'int': int
+}
+
+# marks a variable slot that was not assigned yet
+UNBOUND = object()
+
+# marks arguments a Memo holds no result for
+MISSING = object()
+
+# results each pure function keeps by default, see purity.py
+MEMOSIZE = 1024
+
+def memokey(args):
+    """Return the Memo key of a list of argument values"""
+    # the types are part of the key so f(1), f(True) and f(1.0) differ
+    return (*args, *map(type, args))
+
+class Memo:
+    """The results of a pure function by arguments, least recently used first"""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the result stored for key, or MISSING"""
+        value = self.results.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Store a result, evicting the least recently used one when full"""
+        self.results[key] = value
+        if len(self.results) > self.size:
+            self.results.popitem(last = False)
+
+class Globals:
+    """The global variables of a program, stored in numbered slots"""
+
+    def __init__(self):
+        self.slots = {}
+        self.names = []
+        self.values = []
+        # result caches of the pure functions, none when memosize is 0
+        self.memosize = MEMOSIZE
+        self.memos = []
+        # the globals as a dict for the python backend, see transpiler.py
+        self.namespace = None
+        # the Profiler the backends report calls and lines to, if any
+        self.profiler = None
+        # whether the program comes in fragments that share these globals,
+        # as in the REPL
+        self.interactive = False
+
+    def slot(self, name):
+        """Return the slot of a global name, adding an unbound one if needed"""
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.values)
+            self.names.append(name)
+            self.values.append(UNBOUND)
+        return slot
+
+    def __contains__(self, name):
+        return name in self.slots and self.values[self.slots[name]] is not UNBOUND
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return self.values[self.slots[name]]
+
+    def __setitem__(self, name, value):
+        self.values[self.slot(name)] = value
+
+    def get(self, name, default = None):
+        return self[name] if name in self else default
+
+    def items(self):
+        """Return the names and values of the bound globals"""
+        return [(name, value) for name, value in zip(self.names, self.values) if value is not UNBOUND]
+
+    def memo(self, name):
+        """Return a new result cache for the pure function name"""
+        memo = Memo(name, self.memosize)
+        self.memos.append(memo)
+        return memo
+
+    def memoCounts(self):
+        """Return the hits and misses of every result cache"""
+        counts = {}
+        for memo in self.memos:
+            counts[memo.name + '.hits'] = memo.hits
+            counts[memo.name + '.misses'] = memo.misses
+        return counts
+
+def undefined(name):
+    """Raise the error for a name that has no value"""
+    raise Exception("Undefined name %s" % name)
+
+def arity(name, expected, given):
+    """Raise the error for a call with the wrong number of arguments"""
+    raise Exception("%s() takes %d arguments but %d were given" % (name, expected, given))
+
+def isFunction(arena, index):
+    """Check if an AssignStmt defines a function"""
+    # AssignStmt with a name is a function definition, otherwise its
+    # children are the variable and the expression or augmented op
+    return arena.values[index] is not None
+
+def binaryChain(arena, index):
+    """Return the leftmost operand of a chain of binary operators, and its operators and right operands in order"""
+    # walk down the left spine of the chain with a loop, so the backends
+    # do not recurse on long left associative chains. an augmented
+    # assignment gives the operator it applies
+    chain = []
+    while NODETYPES[arena.kinds[index]] == ASTNodeType.BinaryOp:
+        op = arena.values[index]
+        left = arena.first[index]
+        chain.append((augassigns.get(op, op), arena.next[left]))
+        index = left
+    chain.reverse()
+    return index, chain
+
+def assigned(arena, index):
+    """Return the names assigned in a body, outside nested functions"""
+    names = set()
+    stack = [index]
+    while stack:
+        for child in arena.children(stack.pop()):
+            kind = NODETYPES[arena.kinds[child]]
+            if kind == ASTNodeType.AssignStmt:
+                name = arena.values[child]
+                if name is None:
+                    name = arena.values[arena.first[child]]
+                names.add(name)
+            elif kind == ASTNodeType.IfStmt or kind == ASTNodeType.Body:
+                stack.append(child)
+    return names
@@ -1,4 +1,8 @@
+import re
+import mmap
+from array import array
 from enum import Enum
+
 class Type(Enum):
     # organization types
     LPAREN = 0
@@ -46,6 +50,39 @@ class Type(Enum):
     DSTAREQ = 42
     LEQ = 43
     GEQ = 44
+
+# group numbers of Tokenizer.pattern
+SPACE = 1
+NEWLINE = 2
+COMMENT = 3
+NAME = 4
+INTEGER = 5
+STRING = 6
+QUOTE = 7
+LEFTLEVEL = 8
+RIGHTLEVEL = 9
+OPERATOR = 10
+INVALID = 11
+
+# characters read from a file at a time when streaming tokens
+CHUNKSIZE = 1 << 16
+
+escapes = {
+    'n': '\n',
+    't': '\t',
+    '\\': '\\'
+}
+
+def unescape(string):
+    """Replace the escape sequences in a string literal"""
+    if '\\' not in string:
+        return string
+    return re.sub(r'\\(.)', lambda match: escapes.get(match.group(1), match.group(0)), string)
+
+def escape(string):
+    """Write a string as the body of a string literal"""
+    return string.replace('\\', '\\\\').replace('\n', '\\n').replace('\t', '\\t')
+
 class Token:
     def __init__(self, type, value, line):
         self.type = type
@@ -109,145 +146,275 @@ class Tokenizer:
         '>=': Type.GEQ
     }
 
+    # keywords are scanned as names and looked up afterwards, so a keyword
+    # that prefixes a longer name (e.g. 'or' in 'order') stays part of it
+    keywords = {symbol: token for symbol, token in multicharSymbols.items() if symbol.isalpha()}
+
+    operators = {
+        **symbols,
+        **{symbol: token for symbol, token in multicharSymbols.items() if not symbol.isalpha()}
+    }
+
+    # one alternative per kind of token, tried in order at each position.
+    # operators are sorted longest first so the longest symbol always wins
+    # (maximal munch), and the last group catches any unreadable character
+    pattern = re.compile('|'.join([
+        r'( +)',
+        r'(\n)',
+        r'(#[^\n]*\n?)',
+        r'([A-Za-z_]+)',
+        r'([0-9]+)',
+        r'"([^"]*)(")?',
+        r'([(\[{])',
+        r'([)\]}])',
+        '(' + '|'.join(re.escape(op) for op in sorted(operators, key=len, reverse=True)) + ')',
+        r'(.)'
+    ]))
+
+    # the same pattern and tables for bytes, which are scanned in place
+    bytepattern = re.compile(pattern.pattern.encode())
+    bytekeywords = {symbol.encode(): token for symbol, token in keywords.items()}
+    byteoperators = {symbol.encode(): token for symbol, token in operators.items()}
+    byteleftlevels = {symbol.encode(): token for symbol, token in leftlevels.items()}
+    byterightlevels = {symbol.encode(): token for symbol, token in rightlevels.items()}
+
     def __init__(self, input):
         self.line = 1
         self.level = 0
         self.input = input
-        self.eof = len(self.input)
+        self.offset = 0
 
-    def isvalidchar(self, char):
-        return self.isalpha(char) or ord(char) == 95
+    def tokenize(self):
+        """Return a TokenStore of every token in the input"""
+        source = self.input
+        if hasattr(source, 'read'):
+            source = source.read()
+        store = TokenStore(source)
+        self.scan(source, 0, len(source), True, store)
+        store.add(Type.EOF, self.line)
+        return store
 
-    def isalpha(self, char):
-        return (ord(char) >= 65 and ord(char) <= 90) or (ord(char) >= 97 and ord(char) <= 122)
+    def stores(self, chunksize=CHUNKSIZE):
+        """Yield a TokenStore per chunk of input, the last one ending with EOF"""
+        if isinstance(self.input, (bytes, mmap.mmap)):
+            yield from self.mapped(chunksize)
+            return
 
-    def isnumeric(self, char):
-        return ord(char) >= 48 and ord(char) <= 57
+        # only complete lines are scanned until the input runs out, so a
+        # token is never cut in half at a chunk boundary. whatever is left
+        # after the last newline is carried over into the next chunk
+        buffer = ''
+        for chunk in self.chunks(chunksize):
+            buffer += chunk
+            store = TokenStore(buffer)
+            consumed = self.scan(buffer, 0, buffer.rfind('\n') + 1, False, store)
+            yield store
+            buffer = buffer[consumed:]
+            self.offset += consumed
+        store = TokenStore(buffer)
+        self.scan(buffer, 0, len(buffer), True, store)
+        store.add(Type.EOF, self.line)
+        yield store
 
-    def tokenizeWhitespace(self, current):
-        """Tokenize whitespace and ignore commented lines"""
-        if self.input[current] == ' ':
-            return 1, None
-        elif self.input[current] == '\n':
-            if self.level == 0:
-                self.line += 1
-                return 1, Token(Type.NEWLINE, None, self.line - 1)
-            return 1, None
-        elif self.input[current] == '#':
-            consumed = 1
-            while current + consumed < self.eof and self.input[current+consumed] != '\n':
-                consumed += 1
-            self.line += 1
-            return consumed+1, None
-        return 0, None
-        
-    def tokenizeMultiCharSymbol(self, current):
-        """Tokenize a multi character symbol"""
-
-        for symbol, token in self.multicharSymbols.items():
-            curr = self.input[current]
-            consumed = 0
-            while consumed < len(symbol) and symbol[consumed] == curr:
-                consumed += 1
-                if current + consumed < self.eof:
-                    curr = self.input[current + consumed]
+    def mapped(self, chunksize):
+        """Yield a TokenStore per window of bytes or a memory mapped file, scanning it in place"""
+
+        # the pattern runs over the input itself, one window of complete
+        # lines at a time, so nothing is copied and lexemes are only sliced
+        # out when the parser asks for them. once the parser is past a
+        # window the pages of a mapped file are given back, so only the
+        # last windows stay resident
+        data = self.input
+        size = len(data)
+        release = isinstance(data, mmap.mmap) and hasattr(data, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+        position = previous = released = 0
+        window = chunksize
+        while True:
+            end = size
+            if position + window < size:
+                end = data.rfind(b'\n', position, position + window) + 1
+                if end <= position:
+                    # a line longer than the window
+                    window *= 2
+                    continue
+            store = TokenStore(data)
+            reached = self.scan(data, position, end, end == size, store)
+            if end == size:
+                store.add(Type.EOF, self.line)
+                yield store
+                return
+            if reached == position:
+                # a string that does not end in the window
+                window *= 2
+                continue
+            yield store
+            # the parser reads at most one token back, so only the window
+            # before this one may still be sliced
+            if release and previous - released >= chunksize:
+                unused = previous - previous % mmap.PAGESIZE
+                data.madvise(mmap.MADV_DONTNEED, released, unused - released)
+                released = unused
+            previous = position
+            position = reached
+            window = chunksize
+
+    def chunks(self, chunksize):
+        """Yield the input in chunks of at most chunksize characters"""
+        if not hasattr(self.input, 'read'):
+            yield self.input
+            return
+        chunk = self.input.read(chunksize)
+        while chunk:
+            yield chunk
+            chunk = self.input.read(chunksize)
+
+    def scan(self, buffer, start, end, final, store):
+        """Append the tokens of buffer between start and end to store and return the position reached"""
+
+        # the buffer is scanned once with a single combined pattern, and
+        # every character of it is matched by exactly one group so the
+        # matches cover it back to back. tokens go into the columns of the
+        # store, and names, integers and strings only as their span in the
+        # buffer. bytes are scanned with the byte pattern and tables
+
+        if isinstance(buffer, str):
+            pattern = self.pattern
+            keywords = self.keywords
+            operators = self.operators
+            leftlevels = self.leftlevels
+            rightlevels = self.rightlevels
+            newline = '\n'
+        else:
+            pattern = self.bytepattern
+            keywords = self.bytekeywords
+            operators = self.byteoperators
+            leftlevels = self.byteleftlevels
+            rightlevels = self.byterightlevels
+            newline = b'\n'
+
+        types = store.types.append
+        starts = store.starts.append
+        lengths = store.lengths.append
+        lines = store.lines.append
+
+        for match in pattern.finditer(buffer, start, end):
+            kind = match.lastindex
+            if kind == SPACE:
+                continue
+            elif kind == NAME:
+                value = match.group(NAME)
+                if value in keywords:
+                    types(keywords[value].value)
+                    starts(0)
+                    lengths(0)
                 else:
-                    return 0, None
-            if consumed == len(symbol) and self.input[current:current+consumed] == symbol:
-                return consumed, Token(token, None, self.line)
-        return 0, None
-
-    def tokenizeSymbol(self, current):
-        """Tokenize a symbol"""
-
-        if self.input[current] in self.symbols:
-            return 1, Token(self.symbols[self.input[current]], None, self.line)
-        elif self.input[current] in self.leftlevels:
-            self.level += 1
-            return 1, Token(self.leftlevels[self.input[current]], None, self.line)
-        elif self.input[current] in self.rightlevels:
-            self.level -= 1
-            return 1, Token(self.rightlevels[self.input[current]], None, self.line)
-        return 0, None
-    
-    def tokenizeInteger(self, current):
-        """Tokenize an integer"""
-
-        curr = self.input[current]
-        consumed = 0
-        while self.isnumeric(curr):
-            consumed += 1
-            if current + consumed < self.eof:
-                curr = self.input[current+consumed]
+                    first, last = match.span(NAME)
+                    types(Type.NAME.value)
+                    starts(first)
+                    lengths(last - first)
+                lines(self.line)
+            elif kind == OPERATOR:
+                types(operators[match.group(OPERATOR)].value)
+                starts(0)
+                lengths(0)
+                lines(self.line)
+            elif kind == NEWLINE:
+                if self.level == 0:
+                    types(Type.NEWLINE.value)
+                    starts(0)
+                    lengths(0)
+                    lines(self.line)
+                self.line += 1
+            elif kind == INTEGER:
+                first, last = match.span(INTEGER)
+                types(Type.INT.value)
+                starts(first)
+                lengths(last - first)
+                lines(self.line)
+            elif kind == QUOTE:
+                first, last = match.span(STRING)
+                types(Type.STRING.value)
+                starts(first)
+                lengths(last - first)
+                lines(self.line)
+                self.line += match.group(STRING).count(newline)
+            elif kind == LEFTLEVEL:
+                self.level += 1
+                types(leftlevels[match.group(LEFTLEVEL)].value)
+                starts(0)
+                lengths(0)
+                lines(self.line)
+            elif kind == RIGHTLEVEL:
+                self.level -= 1
+                types(rightlevels[match.group(RIGHTLEVEL)].value)
+                starts(0)
+                lengths(0)
+                lines(self.line)
+            elif kind == STRING:
+                # no closing quote yet, it may still be in the next chunk
+                if not final:
+                    return match.start()
+                self.invalid(match)
+            elif kind == COMMENT:
+                # a comment swallows the newline that ends it
+                self.line += 1
             else:
-                break
-        if consumed != 0:
-            return consumed, Token(Type.INT, self.input[current:current+consumed], self.line)
-        return 0, None
-
-    def tokenizeString(self, current):
-        """Tokenize a string"""
-
-        if self.input[current] == '"':
-            consumed = 1
-            curr = self.input[current + consumed]
-            while curr != '"':
-                consumed += 1
-                if current + consumed < self.eof:
-                    curr = self.input[current+consumed]
-                else:
-                    break
-            if curr == '"':
-                return consumed + 1, Token(Type.STRING, self.input[current+1:current+consumed], self.line)
+                self.invalid(match)
+        return end
+
+    def invalid(self, match):
+        """Raise an error for the unreadable character at match"""
+        character = match.group(0)
+        if isinstance(character, bytes):
+            if match.lastindex == INVALID:
+                # the match is one byte, of what may be a longer utf-8 character
+                character = match.string[match.start():match.start() + 4].decode(errors = 'replace')[0]
             else:
-                return 0, None
-        return 0, None
-    
-    def tokenizeName(self, current):
-        """Tokenize a user defined symbol (name)"""
-
-        consumed = 0
-        while current + consumed < self.eof and self.isvalidchar(self.input[current + consumed]):
-            consumed += 1
-        if consumed != 0:
-            return consumed, Token(Type.NAME, self.input[current:current+consumed], self.line)
-        return 0, None
+                character = character.decode(errors = 'replace')
+        raise Exception("Unreadable or invalid character %s at token %d during tokenization" % (character, self.offset + match.start()))
 
-    def tokenize(self):
-        """Return list of tokens from input"""
-
-        # look through and try each tokenizer in our list of tokenizers
-        # the tokenizers are ordered to make sure we capture language 
-        # specific symbol names before variable names
-        # if a tokenizer is successful it will return a number 
-        # of consumed tokens and a token from Type
-        # we continue consuming tokens until there are no
-        # more tokens left in the input
-
-        tokenizers = [
-            self.tokenizeWhitespace,
-            self.tokenizeMultiCharSymbol, 
-            self.tokenizeSymbol,
-            self.tokenizeInteger,
-            self.tokenizeString,
-            self.tokenizeName
-        ]
-
-        current = 0
-        tokens = []
-        while current < self.eof:
-            tokenized = False
-            for tokenizer in tokenizers:
-                if tokenized:
-                    break
-                consumed, token = tokenizer(current)
-                if consumed != 0:
-                    current += consumed
-                    tokenized = True
-                if token:
-                    tokens.append(token)
-            if not tokenized:
-                print(self.eof)
-                raise Exception("Unreadable or invalid character %c at token %d during tokenization" % (self.input[current], current))
-        tokens.append(Token(Type.EOF, None, self.line))
-        return tokens 
\ No newline at end of file
+class TokenStore:
+    """Tokens stored as parallel arrays of type code, start, length and line"""
+
+    # Type by type code
+    kinds = tuple(Type)
+
+    # type codes of the tokens whose value is their lexeme in the source
+    lexemes = {Type.NAME.value, Type.INT.value, Type.STRING.value}
+
+    def __init__(self, source):
+        # source is the str, bytes or mmap the tokens were scanned from
+        self.source = source
+        self.decode = not isinstance(source, str)
+        self.types = array('B')
+        self.starts = array('Q')
+        self.lengths = array('I')
+        self.lines = array('I')
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        return Token(self.kinds[self.types[index]], self.value(index), self.lines[index])
+
+    def add(self, type, line):
+        """Append a token without a lexeme"""
+        self.types.append(type.value)
+        self.starts.append(0)
+        self.lengths.append(0)
+        self.lines.append(line)
+
+    def kind(self, index):
+        """Type of the token at index"""
+        return self.kinds[self.types[index]]
+
+    def value(self, index):
+        """Lexeme of the token at index, sliced out of the source on demand"""
+        if self.types[index] in self.lexemes:
+            start = self.starts[index]
+            value = self.source[start:start + self.lengths[index]]
+            return value.decode() if self.decode else value
+
+    def line(self, index):
+        """Line of the token at index"""
+        return self.lines[index]
@@ -0,0 +1,391 @@
+import ast as pyast
+import functools
+import keyword
+import re
+import types
+from tokenizer import Type
+from parser import ASTNodeType, NODETYPES
+from runtime import binaryops, builtins, undefined, arity, assigned, memokey, isFunction, binaryChain, CHAIN, MISSING
+from resolver import Resolver
+import purity
+
+# python ast operator for every jutsu operator
+arithmetic = {
+    Type.PLUS: pyast.Add,
+    Type.MINUS: pyast.Sub,
+    Type.MULT: pyast.Mult,
+    Type.DIV: pyast.Div,
+    Type.IDIV: pyast.FloorDiv,
+    Type.PERCENT: pyast.Mod,
+    Type.DSTAR: pyast.Pow
+}
+
+comparisons = {
+    Type.DEQ: pyast.Eq,
+    Type.NEQ: pyast.NotEq,
+    Type.LT: pyast.Lt,
+    Type.GT: pyast.Gt,
+    Type.LEQ: pyast.LtE,
+    Type.GEQ: pyast.GtE
+}
+
+booleans = {
+    Type.OR: pyast.Or,
+    Type.AND: pyast.And
+}
+
+# helper that runs operator chains too long for compile(), the '$' keeps
+# it apart from every jutsu name
+CHAINED = 'chain$'
+
+def chained(value, *rest):
+    """Apply a long operator chain left to right, its operands are thunks"""
+    for i in range(0, len(rest), 2):
+        op, right = rest[i], rest[i + 1]
+        if op == 'OR':
+            value = value or right()
+        elif op == 'AND':
+            value = value and right()
+        else:
+            value = binaryops[Type[op]](value, right())
+    return value
+
+# helpers for tail calls to other functions: a release of such a call
+# returns a Tail, and every other call passes its result through bounce
+TAIL = 'tail$'
+BOUNCE = 'bounce$'
+
+class Tail:
+    """A call returned by a function to be made by its caller"""
+
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+def bounce(result):
+    """Make the tail calls a call returned until one gives a value"""
+    while result.__class__ is Tail:
+        result = result.function(*result.args)
+    return result
+
+# helper that gives a pure function its result cache
+MEMO = 'memo$'
+
+def memoize(function, memo):
+    """Wrap a python function so it keeps its results in a Memo"""
+    def memoized(*args):
+        key = memokey(args)
+        value = memo.get(key)
+        if value is MISSING:
+            value = function(*args)
+            # a Tail is not the result yet, the caller bounces it
+            if value.__class__ is not Tail:
+                memo.put(key, value)
+        return value
+    return functools.update_wrapper(memoized, function)
+
+# helpers that report to the profiler: a call of HIT comes before every
+# statement and PROFILE wraps every function
+HIT = 'hit$'
+PROFILE = 'profile$'
+
+def profile(function, name, profiler):
+    """Wrap a python function so the profiler sees when it starts and stops running"""
+    enter = profiler.enter
+    exit = profiler.exit
+
+    def profiled(*args):
+        enter(name)
+        try:
+            return function(*args)
+        finally:
+            exit()
+    return functools.update_wrapper(profiled, function)
+
+def identifier(name):
+    """Return the python identifier for a jutsu name"""
+    # jutsu names may be python keywords such as class or None, or names
+    # python gives a meaning such as __builtins__. those get a '$', which
+    # no jutsu name has, so no two names end up the same
+    if keyword.iskeyword(name) or (name.startswith('__') and name.endswith('__')):
+        return name + '$'
+    return name
+
+# the function the program runs in
+PROGRAM = 'program$'
+
+class Transpiler:
+    """Translate an AST into a python module"""
+
+    def __init__(self, arena, pure = (), profiling = False, trampoline = False):
+        self.arena = arena
+        # function definitions that get a result cache
+        self.pure = pure
+        # whether to emit the calls that report to the profiler
+        self.profiling = profiling
+        # names local to the function being translated, None at top level
+        self.locals = None
+        # name and parameters of the function being translated, and whether
+        # it made a tail call to itself
+        self.function = None
+        self.looped = False
+        # whether the program releases calls of other functions, which
+        # then have to go through Tail and bounce. fragments of a session
+        # always do, since a function defined by an earlier or later
+        # fragment can return a Tail to them
+        self.tails = False
+        self.trampoline = trampoline
+
+    def kind(self, index):
+        return NODETYPES[self.arena.kinds[index]]
+
+    def children(self, index):
+        return list(self.arena.children(index))
+
+    def load(self, name):
+        return pyast.Name(identifier(name), pyast.Load())
+
+    def referenced(self, index):
+        """Return every name read or called below a node"""
+        names = set()
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            kind = self.kind(node)
+            if kind == ASTNodeType.Variable or (kind == ASTNodeType.CallStmt and self.arena.values[node] != Type.PRINT):
+                names.add(self.arena.values[node])
+            stack.extend(self.arena.children(node))
+        return names
+
+    def transpileProgram(self, index):
+        # the program runs inside a function so a top level release can
+        # return from it, with every top level name declared global
+        body = self.transpileBody(index)
+        if self.tails and not self.trampoline:
+            # calls made so far do not bounce, so translate again
+            self.trampoline = True
+            body = self.transpileBody(index)
+        names = assigned(self.arena, index)
+        if names:
+            body.insert(0, pyast.Global(sorted(map(identifier, names))))
+        program = pyast.FunctionDef(PROGRAM, self.arguments([]), body, [])
+        return pyast.fix_missing_locations(pyast.Module([program], []))
+
+    def arguments(self, params):
+        return pyast.arguments([], [pyast.arg(identifier(param)) for param in params], None, [], [], None, [])
+
+    def transpileBody(self, index):
+        body = []
+        for child in self.arena.children(index):
+            if self.profiling:
+                hit = pyast.Call(pyast.Name(HIT, pyast.Load()), [pyast.Constant(self.arena.lines[child])], [])
+                body.append(pyast.Expr(hit))
+            statement = self.transpileStatement(child)
+            if isinstance(statement, list):
+                body.extend(statement)
+            else:
+                body.append(statement)
+        return body or [pyast.Pass()]
+
+    def transpileStatement(self, index):
+        kind = self.kind(index)
+        if kind == ASTNodeType.Expr:
+            return pyast.Expr(self.transpileExpression(index))
+        return self.statements[kind](self, index)
+
+    def transpileAssignment(self, index):
+        if isFunction(self.arena, index):
+            return self.transpileFunction(index)
+        target, expression = self.children(index)
+        name = pyast.Name(identifier(self.arena.values[target]), pyast.Store())
+        return pyast.Assign([name], self.transpileExpression(expression))
+
+    def transpileFunction(self, index):
+        children = self.children(index)
+        name = self.arena.values[index]
+        params = [self.arena.values[child] for child in children[:-1]]
+
+        outer = (self.locals, self.function, self.looped)
+        self.locals = set(params) | assigned(self.arena, children[-1])
+        self.function = (name, params)
+        self.looped = False
+        body = self.transpileBody(children[-1])
+        if self.looped:
+            # python has no tail calls, so a function that releases a call
+            # of itself runs its body in a loop that rebinds the parameters
+            body = [pyast.While(pyast.Constant(True), body + [pyast.Return(None)], [])]
+        if outer[0] is not None:
+            # jutsu functions do not close over the function around them,
+            # the names they do not assign are always globals
+            free = self.referenced(children[-1]) - self.locals
+            if free:
+                body.insert(0, pyast.Global(sorted(map(identifier, free))))
+        self.locals, self.function, self.looped = outer
+
+        statements = [pyast.FunctionDef(identifier(name), self.arguments(params), body, [])]
+        # the result cache goes around the profiled function, so a call it
+        # answers does not run the function as far as the profiler sees
+        for helper, wrapped in ((PROFILE, self.profiling), (MEMO, index in self.pure)):
+            if wrapped:
+                call = pyast.Call(pyast.Name(helper, pyast.Load()), [self.load(name), pyast.Constant(name)], [])
+                statements.append(pyast.Assign([pyast.Name(identifier(name), pyast.Store())], call))
+        return statements[0] if len(statements) == 1 else statements
+
+    def transpileReturn(self, index):
+        children = self.children(index)
+        if not children:
+            return pyast.Return(None)
+        expression = children[0]
+        while self.kind(expression) == ASTNodeType.Expr:
+            expression = self.arena.first[expression]
+        if self.isSelfCall(expression):
+            args = [self.transpileExpression(self.arena.first[child]) for child in self.arena.children(expression)]
+            params = [pyast.Name(identifier(param), pyast.Store()) for param in self.function[1]]
+            self.looped = True
+            statements = [pyast.Continue()]
+            # the next iteration is a new call, which starts without the
+            # other locals of this one
+            for name in sorted(self.locals - set(self.function[1])):
+                unbind = pyast.Delete([pyast.Name(identifier(name), pyast.Del())])
+                statements.insert(0, pyast.Try([unbind], [pyast.ExceptHandler(None, None, [pyast.Pass()])], [], []))
+            if params:
+                statements.insert(0, pyast.Assign([pyast.Tuple(params, pyast.Store())], pyast.Tuple(args, pyast.Load())))
+            return statements
+        if self.kind(expression) == ASTNodeType.CallStmt:
+            self.tails = True
+            if self.trampoline:
+                args = [self.transpileExpression(self.arena.first[child]) for child in self.arena.children(expression)]
+                return pyast.Return(pyast.Call(pyast.Name(TAIL, pyast.Load()), [self.load(self.arena.values[expression])] + args, []))
+        return pyast.Return(self.transpileExpression(expression))
+
+    def isSelfCall(self, index):
+        """Check if a node calls the function being translated with all its parameters"""
+        # when profiling every call has to go through the profiled function
+        if self.function is None or self.profiling or self.kind(index) != ASTNodeType.CallStmt:
+            return False
+        name, params = self.function
+        # a local of the same name would be some other function
+        return self.arena.values[index] == name and name not in self.locals and len(self.children(index)) == len(params)
+
+    def transpilePrint(self, index):
+        if self.arena.values[index] != Type.PRINT:
+            return pyast.Expr(self.transpileExpression(index))
+        value = self.transpileExpression(self.arena.first[index])
+        return pyast.Expr(pyast.Call(pyast.Name('print', pyast.Load()), [value], []))
+
+    def transpileIf(self, index):
+        test, body = self.children(index)
+        return pyast.If(self.transpileExpression(test), self.transpileBody(body), [])
+
+    def transpileExpression(self, index):
+        return self.expressions[self.kind(index)](self, index)
+
+    def transpileExpr(self, index):
+        return self.transpileExpression(self.arena.first[index])
+
+    def transpileBinary(self, index):
+        index, chain = binaryChain(self.arena, index)
+        value = self.transpileExpression(index)
+
+        if len(chain) > CHAIN:
+            args = [value]
+            for op, right in chain:
+                args.append(pyast.Constant(op.name))
+                args.append(pyast.Lambda(self.arguments([]), self.transpileExpression(right)))
+            return pyast.Call(pyast.Name(CHAINED, pyast.Load()), args, [])
+
+        for op, right in chain:
+            right = self.transpileExpression(right)
+            if op in booleans:
+                value = pyast.BoolOp(booleans[op](), [value, right])
+            elif op in comparisons:
+                value = pyast.Compare(value, [comparisons[op]()], [right])
+            else:
+                value = pyast.BinOp(value, arithmetic[op](), right)
+        return value
+
+    def transpileUnary(self, index):
+        op = pyast.Not() if self.arena.values[index] == Type.NOT else pyast.USub()
+        return pyast.UnaryOp(op, self.transpileExpression(self.arena.first[index]))
+
+    def transpileConstant(self, index):
+        return pyast.Constant(self.arena.constants[self.arena.values[index]])
+
+    def transpileVariable(self, index):
+        return self.load(self.arena.values[index])
+
+    def transpileCall(self, index):
+        args = [self.transpileExpression(self.arena.first[child]) for child in self.arena.children(index)]
+        call = pyast.Call(self.load(self.arena.values[index]), args, [])
+        if self.trampoline:
+            return pyast.Call(pyast.Name(BOUNCE, pyast.Load()), [call], [])
+        return call
+
+    statements = {
+        ASTNodeType.AssignStmt: transpileAssignment,
+        ASTNodeType.ReturnStmt: transpileReturn,
+        ASTNodeType.CallStmt: transpilePrint,
+        ASTNodeType.IfStmt: transpileIf
+    }
+
+    expressions = {
+        ASTNodeType.Expr: transpileExpr,
+        ASTNodeType.BinaryOp: transpileBinary,
+        ASTNodeType.UnaryOp: transpileUnary,
+        ASTNodeType.IntegerConst: transpileConstant,
+        ASTNodeType.StringConst: transpileConstant,
+        ASTNodeType.BooleanConst: transpileConstant,
+        ASTNodeType.Variable: transpileVariable,
+        ASTNodeType.CallStmt: transpileCall
+    }
+
+def translate(error, env):
+    """Raise the jutsu error for a python NameError or call TypeError"""
+    message = str(error)
+    # a name with a '$' is the jutsu name in front of it
+    if isinstance(error, NameError):
+        undefined(re.search(r"'(\w+)\$?'", message).group(1))
+    match = re.match(r"(\w+)\$?\(\) takes (\d+) positional arguments? but (\d+) (?:was|were) given", message)
+    if match:
+        arity(match.group(1), int(match.group(2)), int(match.group(3)))
+    match = re.match(r"(\w+)\$?\(\) missing (\d+) required positional arguments?", message)
+    function = env.get(identifier(match.group(1))) if match else None
+    # memoized and profiled functions keep the function they wrap in __wrapped__
+    while hasattr(function, '__wrapped__'):
+        function = function.__wrapped__
+    if hasattr(function, '__code__'):
+        expected = function.__code__.co_argcount
+        arity(match.group(1), expected, expected - int(match.group(2)))
+    raise error
+
+def process(ast, env):
+    pure = ()
+    if env.memosize > 0:
+        pure = purity.analyze(Resolver(ast.arena, env).resolve(ast.index), ast.index)
+    module = Transpiler(ast.arena, pure, env.profiler is not None, env.interactive).transpileProgram(ast.index)
+    # exec needs the globals as a dict. the Globals keep it, so REPL
+    # fragments and the functions they defined all share one, and only
+    # the names a fragment assigns are copied back when it ends
+    namespace = env.namespace
+    if namespace is None:
+        namespace = env.namespace = {identifier(name): value for name, value in env.items()}
+        memo = lambda function, name: memoize(function, env.memo(name))
+        # jutsu programs only see the jutsu builtins
+        namespace['__builtins__'] = {**builtins, 'print': print, CHAINED: chained, TAIL: Tail, BOUNCE: bounce, MEMO: memo}
+        if env.profiler is not None:
+            namespace['__builtins__'][HIT] = env.profiler.hit
+            namespace['__builtins__'][PROFILE] = lambda function, name: profile(function, name, env.profiler)
+    # the module only defines the program function, which is built
+    # straight from its code object instead of running the module
+    code = compile(module, '<jutsu>', 'exec').co_consts[0]
+    program = types.FunctionType(code, namespace, PROGRAM)
+    try:
+        bounce(program())
+    except (NameError, TypeError) as error:
+        translate(error, namespace)
+    finally:
+        for name in assigned(ast.arena, ast.index):
+            if identifier(name) in namespace:
+                env[name] = namespace[identifier(name)]
@@ -0,0 +1,149 @@
+"""Jutsu test suite
+
+usage: python tests/run.py [-j n] [-b backend] [--update] [path ...]
+
+Runs every .ju program under the given files and directories (all of tests/
+by default) with every backend, in a pool of worker processes that import
+the driver and the backends once, and compares what each program
+prints with the .expected file next to it. Programs in a directory named
+repl are fed to a REPL session a line at a time instead, as typed input.
+Reports the time of every run, slowest first, and exits with 1 if any
+output differs.
+
+-j n      : number of worker processes (default one per cpu)
+-b name   : only run one backend, one of closures, bytecode, adaptive, python
+--update  : write the output of the first backend to the .expected files
+"""
+import concurrent.futures
+import contextlib
+import difflib
+import getopt
+import io
+import os
+import sys
+import time
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(TESTS, '..', 'code'))
+
+from runtime import Globals
+import driver
+import repl
+import interpreter
+import compiler
+import transpiler
+
+BACKENDS = {
+    'closures': interpreter.process,
+    'bytecode': compiler.process,
+    'adaptive': compiler.processAdaptive,
+    'python': transpiler.process
+}
+
+# the same limit as the driver, every jutsu call is several python calls
+sys.setrecursionlimit(10000)
+
+def programs(paths):
+    """Return the .ju files under paths, in a stable order"""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if name != '__jucache__')
+            found.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.ju'))
+    return found
+
+def expected(program):
+    return program[:-len('.ju')] + '.expected'
+
+def execute(ast, backend, env):
+    """Run a program or REPL fragment parsed by the driver as the driver does"""
+    if ast is not None:
+        try:
+            BACKENDS[backend](ast, env)
+        except Exception as e:
+            print("Exception during execution:")
+            print(e)
+
+def session(program, backend):
+    """Feed a program to a REPL session a line at a time"""
+    env = Globals()
+    # the same settings as the REPL of the driver
+    env.memosize = 0
+    env.interactive = True
+    fragments = repl.Session(lambda source: execute(driver.parse(source), backend, env))
+    with open(program, mode='r') as file:
+        for line in file:
+            fragments.feed(line.rstrip('\n'))
+
+def run(program, backend):
+    """Run a program as the driver does and return what it printed and how long it took"""
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        if os.path.basename(os.path.dirname(program)) == 'repl':
+            session(program, backend)
+        else:
+            execute(driver.parseFile(program), backend, Globals())
+    return output.getvalue(), time.perf_counter() - start
+
+def check(program, backend, update):
+    """Run a program and return a line of diff for every difference from its expected output"""
+    output, seconds = run(program, backend)
+    if update:
+        with open(expected(program), mode='w') as file:
+            file.write(output)
+        return [], seconds
+    try:
+        with open(expected(program), mode='r') as file:
+            golden = file.read()
+    except FileNotFoundError:
+        return ["no %s" % os.path.relpath(expected(program))], seconds
+    diff = difflib.unified_diff(golden.splitlines(), output.splitlines(), 'expected', backend, lineterm='')
+    return list(diff), seconds
+
+def main(paths, backends, workers, update):
+    if update:
+        # every backend prints the same, one of them writes the files
+        backends = backends[:1]
+    jobs = [(program, backend) for program in programs(paths) for backend in backends]
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(check, program, backend, update) for program, backend in jobs]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for (program, backend), (diff, seconds) in sorted(zip(jobs, results), key=lambda result: -result[1][1]):
+        status = 'FAIL' if diff else ('UPDATE' if update else 'ok')
+        print("%-6s %8.1fms  %-8s  %s" % (status, seconds * 1000, backend, os.path.relpath(program)))
+        for line in diff:
+            print("        " + line)
+        failed += bool(diff)
+    print("%d runs, %d failed in %.1fms" % (len(jobs), failed, elapsed * 1000))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "j:b:", ["update"])
+    except getopt.GetoptError as err:
+        print(err)
+        print(__doc__)
+        sys.exit(2)
+    backends = list(BACKENDS)
+    workers = None
+    update = False
+    for o, a in opts:
+        if o == "-j":
+            workers = int(a)
+        elif o == "-b":
+            if a not in BACKENDS:
+                print("unknown backend %s" % a)
+                sys.exit(2)
+            backends = [a]
+        elif o == "--update":
+            update = True
+    sys.exit(main(args or [TESTS], backends, workers, update))